@@ -1,11 +1,27 @@
+import hashlib
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from src.features import FEATURE_COLUMNS
+from src.simulator import ScenarioEngine
+
+DATA_PATH = str(ROOT / "data" / "raw" / "synthetic_construction_projects.csv")
+MARGIN_MODEL_PATH = str(ROOT / "models" / "margin_model.pkl")
+RISK_MODEL_PATH = str(ROOT / "models" / "risk_model.pkl")
+CACHE_DIR = str(ROOT / "data" / "cache")
+
+MODE_PRODUCTION = "Готовые модели (XGBoost)"
+MODE_CUSTOM = "Обучение на своих данных"
 
 # --- КОНФИГУРАЦИЯ ИМЕН И ПОДСКАЗОК (Словарь для клиента) ---
 INDICATOR_CONFIG = {
@@ -196,6 +212,86 @@ def get_help(var_name):
     return "Пользовательский параметр."
 
 
+# --- КЭШИРОВАНИЕ (данные и модели переживают перезапуски скрипта) ---
+# Ключ данных — sha256 содержимого файла; сами данные передаются
+# в аргументах с "_" и в хэширование Streamlit не попадают.
+
+@st.cache_data(show_spinner=False)
+def load_data(data_hash, _raw):
+    """Разбор CSV один раз на каждое содержимое файла"""
+    return pd.read_csv(io.BytesIO(_raw))
+
+
+@st.cache_data(show_spinner=False)
+def encode_data(data_hash, _df):
+    """Кодирование текстовых колонок + словари категорий (как у LabelEncoder)"""
+    df_encoded = _df.copy()
+    categories = {}
+    for col in _df.columns:
+        if not pd.api.types.is_numeric_dtype(_df[col]):
+            values = _df[col].astype(str)
+            classes = np.sort(values.unique())
+            df_encoded[col] = pd.Index(classes).get_indexer(values)
+            categories[col] = classes.tolist()
+    return df_encoded, categories
+
+
+@st.cache_data(show_spinner=False)
+def column_stats(data_hash, _df_encoded):
+    """min / max / mean по всем колонкам для слайдеров и выводов"""
+    stats = _df_encoded.agg(["min", "max", "mean"])
+    return {col: tuple(float(v) for v in stats[col]) for col in stats.columns}
+
+
+def fit_model(X, y):
+    """Обучение модели на своих данных (выполняется в фоновом потоке)"""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
+    model.fit(X_train, y_train)
+    return model, model.score(X_test, y_test)
+
+
+@st.cache_resource
+def training_jobs():
+    """
+    Фоновые задачи обучения, общие для всех сессий процесса:
+    ключ -> Future. Для своих данных ключ — (хэш данных, цель, признаки),
+    поэтому повторный запуск с тем же выбором берёт готовую модель.
+    """
+    return {"executor": ThreadPoolExecutor(max_workers=1), "futures": {}}
+
+
+def submit_job(key, fn, *args):
+    """Запуск задачи, если она ещё не запущена (упавшая — перезапускается)"""
+    jobs = training_jobs()
+    future = jobs["futures"].get(key)
+    if future is None or (future.done() and future.exception() is not None):
+        future = jobs["executor"].submit(fn, *args)
+        jobs["futures"][key] = future
+    return future
+
+
+@st.cache_resource(show_spinner="Загрузка моделей...")
+def load_engine():
+    """
+    Production-модели и словарь категорий загружаются один раз на процесс;
+    после переобучения ScenarioEngine сам перечитает изменившиеся файлы.
+    """
+    engine = ScenarioEngine(DATA_PATH, MARGIN_MODEL_PATH, RISK_MODEL_PATH, cache_dir=CACHE_DIR)
+    engine.refresh()
+    return engine
+
+
+@st.cache_data(show_spinner=False)
+def engine_summary(fingerprint, _engine):
+    """Диапазоны признаков и категории для слайдеров (по версии данных и моделей)"""
+    return _engine.feature_summary(), _engine.categories()
+
+
 # --- НАСТРОЙКА ИНТЕРФЕЙСА ---
 st.set_page_config(page_title="Risk Analytics Pro", page_icon="🏗️", layout="wide")
 
@@ -229,104 +325,188 @@ with tab3:
 
 # --- ВКЛАДКА: РАБОЧАЯ ОБЛАСТЬ ---
 with tab1:
-    st.sidebar.header("📁 Ввод данных")
-    uploaded_file = st.sidebar.file_uploader("Загрузите историю проектов (CSV)", type=["csv"])
+    st.sidebar.header("🧠 Режим работы")
+    mode = st.sidebar.radio("Источник прогнозов", [MODE_PRODUCTION, MODE_CUSTOM])
 
-    if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-    else:
-        try:
-            df = pd.read_csv('construction_data.csv')
-            st.sidebar.success("Загружен файл по умолчанию.")
-        except:
-            st.info("Пожалуйста, загрузите CSV файл для начала анализа.")
+    if mode == MODE_PRODUCTION:
+        if not all(os.path.exists(p) for p in (DATA_PATH, MARGIN_MODEL_PATH, RISK_MODEL_PATH)):
+            st.info("Готовые модели не найдены. Запустите main.py или выберите обучение на своих данных.")
             st.stop()
 
-    # Кодирование данных (внутреннее)
-    df_encoded = df.copy()
-    label_encoders = {}
-    for col in df_encoded.columns:
-        if df_encoded[col].dtype == 'object':
-            le = LabelEncoder()
-            df_encoded[col] = le.fit_transform(df_encoded[col].astype(str))
-            label_encoders[col] = le
-
-    st.subheader("🎯 Настройка прогнозирования")
-    col_l, col_r = st.columns(2)
-
-    with col_l:
-        # В selectbox отображаем КРАСИВЫЕ имена через format_func
-        target_col = st.selectbox(
-            "Что предсказываем?",
-            options=df.columns,
-            format_func=get_label
-        )
-
-    with col_r:
-        feature_cols = st.multiselect(
-            "Что учитываем при расчете?",
-            options=[c for c in df.columns if c != target_col],
-            default=[c for c in df.columns if c != target_col],
-            format_func=get_label
-        )
-
-    if st.button("🚀 Запустить расчеты ИИ"):
-        X = df_encoded[feature_cols]
-        y = df_encoded[target_col]
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
-        model.fit(X_train, y_train)
-
-        st.session_state['model'] = model
-        st.session_state['features'] = feature_cols
-        st.session_state['target'] = target_col
-
-        acc = model.score(X_test, y_test)
-        st.success(f"Анализ завершен. Точность модели: {acc * 100:.1f}%")
-
-    # СИМУЛЯТОР ДЛЯ КЛИЕНТА
-    if 'model' in st.session_state:
-        st.divider()
-        st.header("⚙️ Интерактивный симулятор сценариев")
-        st.write("Настраивайте параметры ниже, чтобы увидеть прогноз ИИ в режиме реального времени:")
+        engine = load_engine()
 
-        user_input = {}
-        s_cols = st.columns(2)
+        # Переобучение production-моделей — только фоновой задачей
+        st.sidebar.header("🔁 Переобучение")
+        if st.sidebar.button("Переобучить модели в фоне"):
+            from src.train_pipeline import train_models
+
+            submit_job("production", train_models, DATA_PATH, MARGIN_MODEL_PATH, RISK_MODEL_PATH)
+        retrain = training_jobs()["futures"].get("production")
+        if retrain is not None:
+            if not retrain.done():
+                st.sidebar.info("⏳ Идёт переобучение, текущие модели продолжают работать.")
+            elif retrain.exception() is not None:
+                st.sidebar.error(f"Ошибка переобучения: {retrain.exception()}")
+            else:
+                st.sidebar.success("Модели переобучены и подхвачены симулятором.")
 
-        for i, col_name in enumerate(st.session_state['features']):
-            with s_cols[i % 2]:
-                label = get_label(col_name)  # Красивое имя
-                help_text = get_help(col_name)  # Подсказка
+        summary, categories = engine_summary(engine.fingerprint(), engine)
 
-                if col_name in label_encoders:
-                    options = label_encoders[col_name].classes_
-                    selected_option = st.selectbox(f"{label}", options, help=help_text)
-                    user_input[col_name] = label_encoders[col_name].transform([selected_option])[0]
+        st.header("⚙️ Интерактивный симулятор сценариев")
+        st.write("Прогноз маржи и риска перерасхода бюджета по обученным моделям XGBoost:")
+
+        base_index = int(st.number_input(
+            "Базовый проект (индекс в истории)", min_value=0, max_value=engine.n_projects - 1, value=0
+        ))
+        base_row = engine.build_matrix([(base_index, None)])[0]
+        scenario_row = base_row.copy()
+
+        s_cols = st.columns(2)
+        for j, col_name in enumerate(FEATURE_COLUMNS):
+            with s_cols[j % 2]:
+                label = get_label(col_name)
+                help_text = get_help(col_name)
+                key = f"prod_{base_index}_{col_name}"
+
+                if col_name in categories:
+                    options = categories[col_name]
+                    scenario_row[j] = st.selectbox(
+                        label, range(len(options)), index=int(base_row[j]),
+                        format_func=options.__getitem__, help=help_text, key=key
+                    )
                 else:
-                    min_v, max_v = float(df[col_name].min()), float(df[col_name].max())
-                    user_input[col_name] = st.slider(f"{label}", min_v, max_v, float(df[col_name].mean()),
-                                                     help=help_text)
+                    scenario_row[j] = st.slider(
+                        label, float(summary.at[col_name, "min"]), float(summary.at[col_name, "max"]),
+                        float(base_row[j]), help=help_text, key=key
+                    )
 
-        # ПРЕДСКАЗАНИЕ
-        pred_val = st.session_state['model'].predict(pd.DataFrame([user_input]))[0]
+        # ПРЕДСКАЗАНИЕ: базовый проект и сценарий — одной матрицей
+        margin, risk = engine.predict(np.vstack([base_row, scenario_row]))
 
         st.markdown("---")
-        res_1, res_2 = st.columns([1, 2])
+        res_1, res_2, res_3 = st.columns([1, 1, 2])
         with res_1:
-            st.metric(f"Прогноз: {get_label(st.session_state['target'])}", f"{pred_val:.2f}")
-
+            st.metric("Прогноз маржи", f"{margin[1]:.3f}", f"{margin[1] - margin[0]:+.3f}")
         with res_2:
+            st.metric(get_label("Risk_Score"), f"{risk[1]:.2f}", f"{risk[1] - risk[0]:+.2f}",
+                      delta_color="inverse")
+        with res_3:
             st.subheader("Вывод системы:")
-            # используем закодированное значение целевой переменной, чтобы гарантировать числовой тип
-            avg = df_encoded[st.session_state['target']].mean()
-            diff = ((pred_val / avg) - 1) * 100
-
-            if diff > 15:
-                st.warning(f"Прогноз на {diff:.1f}% выше среднего исторического значения. Требуется анализ рисков.")
-            elif diff < -15:
-                st.success(f"Прогноз на {abs(diff):.1f}% лучше средних показателей. Сценарий эффективен.")
+            if risk[1] > 0.6:
+                st.warning("Высокий риск перерасхода бюджета. Требуется управленческое вмешательство.")
+            elif margin[1] < 0:
+                st.warning("Сценарий убыточен: прогнозная маржа отрицательна.")
             else:
-                st.info("Показатели соответствуют среднестатистическим нормам для данного типа проектов.")
+                st.info("Риск перерасхода в допустимых пределах.")
+
+    else:
+        st.sidebar.header("📁 Ввод данных")
+        uploaded_file = st.sidebar.file_uploader("Загрузите историю проектов (CSV)", type=["csv"])
+
+        if uploaded_file:
+            raw = uploaded_file.getvalue()
+        else:
+            try:
+                with open('construction_data.csv', 'rb') as f:
+                    raw = f.read()
+                st.sidebar.success("Загружен файл по умолчанию.")
+            except:
+                st.info("Пожалуйста, загрузите CSV файл для начала анализа.")
+                st.stop()
+
+        data_hash = hashlib.sha256(raw).hexdigest()
+        df = load_data(data_hash, raw)
+
+        # Кодирование данных (внутреннее)
+        df_encoded, categories = encode_data(data_hash, df)
+        stats = column_stats(data_hash, df_encoded)
+
+        st.subheader("🎯 Настройка прогнозирования")
+        col_l, col_r = st.columns(2)
+
+        with col_l:
+            # В selectbox отображаем КРАСИВЫЕ имена через format_func
+            target_col = st.selectbox(
+                "Что предсказываем?",
+                options=df.columns,
+                format_func=get_label
+            )
+
+        with col_r:
+            feature_cols = st.multiselect(
+                "Что учитываем при расчете?",
+                options=[c for c in df.columns if c != target_col],
+                default=[c for c in df.columns if c != target_col],
+                format_func=get_label
+            )
+
+        if st.button("🚀 Запустить расчеты ИИ"):
+            job_key = ("custom", data_hash, target_col, tuple(feature_cols))
+            submit_job(job_key, fit_model, df_encoded[feature_cols], df_encoded[target_col])
+            st.session_state['job'] = job_key
+            st.session_state.pop('model', None)
+
+        # Обучение идёт в фоне и не блокирует интерфейс
+        if 'job' in st.session_state and 'model' not in st.session_state:
+            job_key = st.session_state['job']
+            future = training_jobs()["futures"].get(job_key)
+            if future is None:
+                del st.session_state['job']
+            elif not future.done():
+                st.info("⏳ Модель обучается в фоне. Обновите статус через несколько секунд.")
+                st.button("🔄 Обновить статус")
+            elif future.exception() is not None:
+                st.error(f"Ошибка обучения: {future.exception()}")
+                del st.session_state['job']
+            else:
+                model, acc = future.result()
+                st.session_state['model'] = model
+                st.session_state['features'] = list(job_key[3])
+                st.session_state['target'] = job_key[2]
+                st.success(f"Анализ завершен. Точность модели: {acc * 100:.1f}%")
+
+        # СИМУЛЯТОР ДЛЯ КЛИЕНТА
+        if 'model' in st.session_state:
+            st.divider()
+            st.header("⚙️ Интерактивный симулятор сценариев")
+            st.write("Настраивайте параметры ниже, чтобы увидеть прогноз ИИ в режиме реального времени:")
+
+            user_input = {}
+            s_cols = st.columns(2)
+
+            for i, col_name in enumerate(st.session_state['features']):
+                with s_cols[i % 2]:
+                    label = get_label(col_name)  # Красивое имя
+                    help_text = get_help(col_name)  # Подсказка
+
+                    if col_name in categories:
+                        options = categories[col_name]
+                        selected_option = st.selectbox(f"{label}", options, help=help_text)
+                        user_input[col_name] = options.index(selected_option)
+                    else:
+                        min_v, max_v, mean_v = stats[col_name]
+                        user_input[col_name] = st.slider(f"{label}", min_v, max_v, mean_v,
+                                                         help=help_text)
+
+            # ПРЕДСКАЗАНИЕ
+            pred_val = st.session_state['model'].predict(pd.DataFrame([user_input]))[0]
+
+            st.markdown("---")
+            res_1, res_2 = st.columns([1, 2])
+            with res_1:
+                st.metric(f"Прогноз: {get_label(st.session_state['target'])}", f"{pred_val:.2f}")
+
+            with res_2:
+                st.subheader("Вывод системы:")
+                # используем закодированное значение целевой переменной, чтобы гарантировать числовой тип
+                avg = stats[st.session_state['target']][2]
+                diff = ((pred_val / avg) - 1) * 100
+
+                if diff > 15:
+                    st.warning(f"Прогноз на {diff:.1f}% выше среднего исторического значения. Требуется анализ рисков.")
+                elif diff < -15:
+                    st.success(f"Прогноз на {abs(diff):.1f}% лучше средних показателей. Сценарий эффективен.")
+                else:
+                    st.info("Показатели соответствуют среднестатистическим нормам для данного типа проектов.")
 
 
@@ -1,12 +1,11 @@
+import argparse
 import subprocess
 import os
 import sys
 from pprint import pprint
 
-from src.data_generator import generate_data
-from src.train_regressor import train_regressor
-from src.train_classifier import train_classifier
-from src.simulator import simulate_scenario
+from src.pipeline import default_stages, run_pipeline
+from src.profiling import profile_run
 
 
 def run_web_app():
@@ -30,28 +29,57 @@ def run_web_app():
         print(f"❌ Не удалось запустить веб-интерфейс: {e}")
 
 
+# Отчёт по этапам (JSON + Chrome Trace, открывается в chrome://tracing / Perfetto)
+TRACE_PATH = "reports/pipeline_trace.json"
+
+
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Подготовка данных и моделей + запуск веб-интерфейса")
+    parser.add_argument(
+        "--force", nargs="*", default=None, metavar="STAGE",
+        help="выполнить этапы заново (generate, cache_dataset, train; без имён или all — все)",
+    )
+    parser.add_argument("--no-app", action="store_true", help="не запускать веб-интерфейс")
+    parser.add_argument(
+        "--use-tuned", action="store_true",
+        help="обучать с гиперпараметрами последнего подбора (python -m src.tuning)",
+    )
+    args = parser.parse_args()
+    # Голый --force — заново все этапы
+    force = args.force or (["all"] if args.force is not None else [])
+
     print("==============================================")
     print("🧱 ПОДГОТОВКА СИСТЕМЫ ОПТИМИЗАЦИИ РИСКОВ")
     print("==============================================")
 
-    # 1. Генерация данных
-    print("\n[1/3] Генерация синтетических данных...")
-    generate_data()
-
-    # 2. Обучение моделей (чтобы проверить работоспособность и создать файлы моделей)
-    print("\n[2/3] Обучение моделей и проверка метрик...")
-    reg_metrics = train_regressor()
-    clf_metrics = train_classifier()
+    def launch_app() -> None:
+        print("\nВсе готово! Переходим к визуализации...")
+        run_web_app()
 
-    print("--- Метрики регрессии (Прибыль) ---")
-    pprint(reg_metrics)
-    print("--- Метрики классификации (Риски) ---")
-    pprint(clf_metrics)
+    def report(result) -> None:
+        # Метрики и отчёт по этапам — сразу после обучения, до запуска приложения
+        if result.name != "train":
+            return
+        print("--- Метрики регрессии (Прибыль) ---")
+        pprint(result.result["margin"])
+        print("--- Метрики классификации (Риски) ---")
+        pprint(result.result["risk"])
+        if recorder.spans:
+            print("--- Этапы (wall / CPU / пиковая память) ---")
+            print(recorder.summary())
+            recorder.write(TRACE_PATH)
+            print(f"Трасса этапов: {TRACE_PATH}")
 
-    # 3. Запуск веб-приложения
-    print("\n[3/3] Все готово! Переходим к визуализации...")
-    run_web_app()
+    # Этапы generate -> cache_dataset -> train -> app;
+    # этапы с неизменившимися входами, параметрами и кодом пропускаются
+    # PROFILE_STAGES="train.*.fit,generate.*" — этапы под cProfile (reports/profiles/*.prof)
+    profile_stages = [p for p in os.environ.get("PROFILE_STAGES", "").split(",") if p]
+    stages = default_stages(launch_app=None if args.no_app else launch_app, use_tuned=args.use_tuned)
+    unknown = [name for name in force if name != "all" and name not in {s.name for s in stages}]
+    if unknown:
+        parser.error(f"неизвестные этапы для --force: {', '.join(unknown)}")
+    with profile_run(TRACE_PATH, profile_stages=profile_stages) as recorder:
+        run_pipeline(stages, force=force, on_stage_done=report)
 
 
 if __name__ == "__main__":
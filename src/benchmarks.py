@@ -0,0 +1,391 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+DEFAULT_SIZES = (6_000, 100_000, 1_000_000)
+DEFAULT_HISTORY_PATH = "benchmarks/history.json"
+DEFAULT_BASELINE_PATH = "benchmarks/baseline.json"
+# Допустимое ухудшение относительно baseline (доля)
+DEFAULT_THRESHOLD = 0.2
+
+DATA_PATH = "data/raw/synthetic_construction_projects.csv"
+MARGIN_MODEL_PATH = "models/margin_model.pkl"
+RISK_MODEL_PATH = "models/risk_model.pkl"
+
+SINGLE_CALLS = 200
+BATCH_SCENARIOS = 100_000
+
+# Бюджет времени импорта модулей в свежем процессе (секунды).
+# Тяжёлые зависимости грузятся только там, где нужны, и не должны
+# попадать в sys.modules при импорте этих модулей.
+IMPORT_BUDGETS_S = {
+    "src.pipeline": 1.0,
+    "src.simulator": 1.0,
+    "src.service": 1.0,
+    "src.explainability": 1.0,
+    "src.registry": 1.0,
+    "src.flat_trees": 1.0,
+}
+HEAVY_MODULES = ("xgboost", "sklearn", "shap", "plotly", "matplotlib", "seaborn")
+IMPORT_REPEAT = 3
+
+_ROOT = Path(__file__).resolve().parents[1]
+
+
+# --- Сценарии бенчмарка -------------------------------------------------
+# Каждый выполняется в отдельном процессе в рабочем каталоге своего размера
+# данных и возвращает (число обработанных единиц, единица измерения).
+
+def _bench_generate(size: int) -> tuple:
+    from .data_generator import generate_data
+
+    generate_data(DATA_PATH, n_projects=size)
+    return size, "rows"
+
+
+def _bench_train_regressor(size: int) -> tuple:
+    from .train_regressor import train_regressor
+
+    train_regressor(DATA_PATH, MARGIN_MODEL_PATH)
+    return size, "rows"
+
+
+def _bench_train_classifier(size: int) -> tuple:
+    from .train_classifier import train_classifier
+
+    train_classifier(DATA_PATH, RISK_MODEL_PATH)
+    return size, "rows"
+
+
+def _bench_simulate_single(size: int) -> tuple:
+    from .simulator import simulate_scenario
+
+    rng = np.random.default_rng(0)
+    simulate_scenario(0)  # загрузка моделей и данных — не в замере
+    t0 = time.perf_counter()
+    for i in rng.integers(0, size, SINGLE_CALLS):
+        simulate_scenario(int(i), {"mortgage_rate": 12.0})
+    return SINGLE_CALLS, "calls", time.perf_counter() - t0
+
+
+def _bench_simulate_batch(size: int) -> tuple:
+    import pandas as pd
+
+    from .simulator import simulate_scenarios
+
+    rng = np.random.default_rng(0)
+    scenarios = pd.DataFrame(
+        {
+            "base_index": rng.integers(0, size, BATCH_SCENARIOS),
+            "mortgage_rate": rng.uniform(5, 15, BATCH_SCENARIOS),
+        }
+    )
+    simulate_scenarios(scenarios.head(1))
+    t0 = time.perf_counter()
+    simulate_scenarios(scenarios)
+    return BATCH_SCENARIOS, "scenarios", time.perf_counter() - t0
+
+
+def _bench_explain(size: int) -> tuple:
+    from .explainability import compute_explanations
+
+    compute_explanations(MARGIN_MODEL_PATH, DATA_PATH)
+    compute_explanations(RISK_MODEL_PATH, DATA_PATH)
+    return 2 * size, "rows"
+
+
+def _bench_explain_plots(size: int) -> tuple:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from .explainability import explain_margin, explain_risk
+
+    saved = explain_margin(DATA_PATH, MARGIN_MODEL_PATH, output_dir="reports")
+    saved += explain_risk(DATA_PATH, RISK_MODEL_PATH, output_dir="reports")
+    return len(saved), "plots"
+
+
+CASES: Dict[str, Callable[[int], tuple]] = {
+    "generate": _bench_generate,
+    "train_regressor": _bench_train_regressor,
+    "train_classifier": _bench_train_classifier,
+    "simulate_single": _bench_simulate_single,
+    "simulate_batch": _bench_simulate_batch,
+    "explain": _bench_explain,
+    "explain_plots": _bench_explain_plots,
+}
+
+
+_MODELS = ("generate", "train_regressor", "train_classifier")
+_REQUIRES = {
+    "train_regressor": ("generate",),
+    "train_classifier": ("generate",),
+    "simulate_single": _MODELS,
+    "simulate_batch": _MODELS,
+    "explain": _MODELS,
+    "explain_plots": _MODELS,
+}
+_OUTPUTS = {
+    "generate": DATA_PATH,
+    "train_regressor": MARGIN_MODEL_PATH,
+    "train_classifier": RISK_MODEL_PATH,
+}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """
+    Пиковая RSS процесса: resource (Unix), иначе psutil (Windows — peak_wset);
+    None, если замерить нечем.
+    """
+    try:
+        import resource
+    except ImportError:
+        pass
+    else:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    return getattr(memory, "peak_wset", memory.rss) / 2**20
+
+
+def _run_case(name: str, size: int, workdir: str) -> Dict[str, Any]:
+    """
+    Выполняется в дочернем процессе: пиковая RSS процесса относится
+    только к этому сценарию.
+    """
+    os.chdir(workdir)
+    t0 = time.perf_counter()
+    result = CASES[name](size)
+    wall = time.perf_counter() - t0
+    units, unit = result[:2]
+    # Сценарий может сам замерить рабочую часть (без прогрева)
+    timed = result[2] if len(result) > 2 else wall
+    return {
+        "case": name,
+        "size": size,
+        "wall_s": wall,
+        "peak_rss_mb": _peak_rss_mb(),
+        "throughput": units / timed if timed > 0 else None,
+        "unit": f"{unit}/s",
+    }
+
+
+def run_benchmarks(
+    sizes: Sequence[int] = DEFAULT_SIZES,
+    cases: Sequence[str] = tuple(CASES),
+    workdir: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Прогон сценариев для каждого размера данных. Сценарии идут
+    в порядке CASES (данные -> модели -> симуляция -> объяснения)
+    в общем рабочем каталоге размера; каждый — в свежем процессе.
+    """
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        raise KeyError(f"Неизвестные сценарии: {sorted(unknown)}")
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix="bench-")
+
+    # Данные и модели для выбранных сценариев создаются, даже если их
+    # сценарии не выбраны (в результаты такие прогоны не попадают)
+    prerequisites = {dep for name in cases for dep in _REQUIRES.get(name, ())}
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in sizes:
+        size_dir = Path(workdir) / str(size)
+        size_dir.mkdir(parents=True, exist_ok=True)
+        for name in CASES:
+            if name not in cases and (
+                name not in prerequisites or (size_dir / _OUTPUTS[name]).exists()
+            ):
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                row = pool.submit(_run_case, name, size, str(size_dir)).result()
+            if name in cases:
+                results.append(row)
+                print(_format_row(row))
+    return results
+
+
+def _format_row(row: Dict[str, Any]) -> str:
+    flag = f"  <-- {row['regression']}" if row.get("regression") else ""
+    throughput = f"{row['throughput']:,.0f} {row['unit']}" if row["throughput"] else "-"
+    rss = f"{row['peak_rss_mb']:>9.0f}" if row["peak_rss_mb"] is not None else f"{'-':>9}"
+    return (
+        f"{row['case']:<18} {row['size']:>10,} {row['wall_s']:>9.2f}s "
+        f"{rss} MB  {throughput}{flag}"
+    )
+
+
+def _key(row: Dict[str, Any]) -> str:
+    return f"{row['case']}@{row['size']}"
+
+
+def _read_json(path: str, default: Any) -> Any:
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: Any) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=Path(path).parent, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def compare_to_baseline(
+    results: List[Dict[str, Any]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[Dict[str, Any]]:
+    """
+    Отмечает в results ухудшения больше threshold по времени или пиковой
+    памяти относительно baseline. Возвращает список регрессий.
+    """
+    regressions = []
+    for row in results:
+        base = baseline.get(_key(row))
+        if not base:
+            continue
+        problems = []
+        for metric in ("wall_s", "peak_rss_mb"):
+            if base.get(metric) and row[metric] is not None and row[metric] > base[metric] * (1 + threshold):
+                problems.append(f"{metric} {row[metric]:.2f} vs {base[metric]:.2f}")
+        if problems:
+            row["regression"] = "; ".join(problems)
+            regressions.append(row)
+    return regressions
+
+
+_IMPORT_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"import_s": elapsed, "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def check_import_times(
+    budgets: Optional[Dict[str, float]] = None,
+    repeat: int = IMPORT_REPEAT,
+) -> List[Dict[str, Any]]:
+    """
+    Время импорта каждого модуля в свежем интерпретаторе (лучшее из repeat,
+    без старта самого Python) и загруженные при этом тяжёлые зависимости.
+    Модуль не проходит проверку, если превышен бюджет или подтянулась
+    тяжёлая зависимость.
+    """
+    budgets = budgets or IMPORT_BUDGETS_S
+    rows = []
+    for module, budget in budgets.items():
+        probe = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+        best: Dict[str, Any] = {}
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", probe], cwd=_ROOT, capture_output=True, text=True, check=True
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            if not best or result["import_s"] < best["import_s"]:
+                best = result
+        rows.append(
+            {
+                "module": module,
+                "import_s": best["import_s"],
+                "budget_s": budget,
+                "heavy": best["heavy"],
+                "ok": best["import_s"] <= budget and not best["heavy"],
+            }
+        )
+    return rows
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарки генерации, обучения, симуляции и объяснений")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--workdir", default=None, help="каталог для данных и моделей (по умолчанию временный)")
+    parser.add_argument("--history", default=DEFAULT_HISTORY_PATH)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--update-baseline", action="store_true", help="записать результаты как новый baseline")
+    parser.add_argument(
+        "--check-imports", action="store_true",
+        help="только проверка времени импорта модулей (IMPORT_BUDGETS_S)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.check_imports:
+        print(f"{'module':<20} {'import':>9} {'budget':>8}  heavy deps")
+        rows = check_import_times()
+        for row in rows:
+            flag = "" if row["ok"] else "  <-- FAIL"
+            print(
+                f"{row['module']:<20} {row['import_s']:>8.3f}s {row['budget_s']:>7.1f}s  "
+                f"{', '.join(row['heavy']) or '-'}{flag}"
+            )
+        if not all(row["ok"] for row in rows):
+            sys.exit(1)
+        return
+
+    print(f"{'case':<18} {'size':>10} {'wall':>10} {'peak RSS':>12}  throughput")
+    results = run_benchmarks(args.sizes, args.cases, args.workdir)
+
+    baseline = _read_json(args.baseline, {})
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+
+    history = _read_json(args.history, [])
+    history.append(
+        {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }
+    )
+    _write_json(args.history, history)
+    print(f"\nРезультаты добавлены в {args.history}")
+
+    if args.update_baseline:
+        baseline.update(
+            {_key(r): {"wall_s": r["wall_s"], "peak_rss_mb": r["peak_rss_mb"]} for r in results}
+        )
+        _write_json(args.baseline, baseline)
+        print(f"Baseline обновлён: {args.baseline}")
+    elif regressions:
+        print(f"\n⚠️ Регрессии относительно {args.baseline} (порог {args.threshold:.0%}):")
+        for row in regressions:
+            print(_format_row(row))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .profiling import span
+
+
+DATA_PATH = "data/raw/synthetic_construction_projects.csv"
+DEFAULT_N_SPLITS = 5
+SPLITS = ("auto", "kfold", "stratified", "group", "time")
+
+# Цели: колонка набора данных и тип модели
+TARGETS = {
+    "margin": "actual_margin",
+    "risk": "budget_overrun",
+}
+
+
+def assign_folds(
+    n_splits: int,
+    split: str,
+    y: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    order: Optional[np.ndarray] = None,
+    seed: int = 42,
+) -> np.ndarray:
+    """
+    Номер тестового фолда для каждой строки (int16):
+    - kfold / stratified / group — каждая строка тестовая ровно в одном
+      из n_splits фолдов, обучение — на остальных,
+    - time — строки по возрастанию order (по умолчанию — порядок строк)
+      делятся на n_splits + 1 последовательных блоков 0..n_splits;
+      блок 0 только обучающий, фолд k тестируется на блоке k
+      и обучается на всех более ранних (расширяющееся окно).
+    """
+    from sklearn.model_selection import GroupKFold, KFold, StratifiedKFold
+
+    folds = np.empty(len(y), dtype=np.int16)
+    rows = np.arange(len(y))
+    if split == "time":
+        ranked = np.argsort(order, kind="stable") if order is not None else rows
+        blocks = np.array_split(ranked, n_splits + 1)
+        for k, block in enumerate(blocks):
+            folds[block] = k
+        return folds
+
+    if split == "kfold":
+        splitter = KFold(n_splits, shuffle=True, random_state=seed).split(rows)
+    elif split == "stratified":
+        splitter = StratifiedKFold(n_splits, shuffle=True, random_state=seed).split(rows, y)
+    elif split == "group":
+        if groups is None:
+            raise ValueError("Для split='group' нужна колонка групп")
+        splitter = GroupKFold(n_splits).split(rows, y, groups)
+    else:
+        raise ValueError(f"Неизвестный способ разбиения: {split}")
+    for k, (_, test_idx) in enumerate(splitter):
+        folds[test_idx] = k
+    return folds
+
+
+# --- Общая память ------------------------------------------------------
+# Матрица признаков, цель и номера фолдов лежат в одном сегменте
+# shared_memory; рабочие процессы подключаются к нему по имени,
+# ничего не копируя при передаче задачи.
+
+def _to_shared(arrays: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, Dict[str, Tuple]]:
+    layout = {}
+    offset = 0
+    for name, a in arrays.items():
+        offset = -(-offset // 64) * 64  # выравнивание
+        layout[name] = (offset, a.shape, a.dtype.str)
+        offset += a.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, a in arrays.items():
+        start, shape, dtype = layout[name]
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=start)[...] = a
+    return shm, layout
+
+
+def _fit_fold(
+    shm_name: str,
+    layout: Dict[str, Tuple],
+    target: str,
+    fold: int,
+    expanding: bool,
+    params: Optional[Dict[str, Any]],
+    n_jobs: int,
+) -> Dict[str, Any]:
+    from .train_classifier import _evaluate_classifier, _make_classifier
+    from .train_regressor import _evaluate_regressor, _make_regressor
+
+    # Рабочие процессы (spawn) используют resource_tracker родителя,
+    # поэтому подключение не приводит к удалению сегмента при их выходе
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = {
+            name: np.ndarray(shape, dtype, buffer=shm.buf, offset=start)
+            for name, (start, shape, dtype) in layout.items()
+        }
+        folds = view["folds"]
+        test = folds == fold
+        train = (folds < fold) if expanding else ~test
+        X_train, y_train = view["X"][train], view["y"][train]
+        X_test, y_test = view["X"][test], view["y"][test]
+        del view, folds
+    finally:
+        shm.close()
+
+    if target == "risk":
+        model, evaluate = _make_classifier(n_jobs=n_jobs, params=params), _evaluate_classifier
+    else:
+        model, evaluate = _make_regressor(n_jobs=n_jobs, params=params), _evaluate_regressor
+
+    t0 = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_s = time.perf_counter() - t0
+    # Один прогноз на валидационный кусок — и для OOF, и для метрик фолда
+    if target == "risk":
+        pred = model.predict_proba(X_test)[:, 1]
+    else:
+        pred = model.predict(X_test)
+    metrics = evaluate(_ProbaModel(pred), X_test, y_test)
+    return {
+        "fold": fold,
+        "n_train": int(len(y_train)),
+        "n_test": int(len(y_test)),
+        "fit_s": fit_s,
+        "metrics": metrics,
+        "pred": pred.astype(np.float32),
+    }
+
+
+def _aggregate(folds: List[Dict[str, Any]]) -> Tuple[Dict[str, float], Dict[str, float]]:
+    names = [
+        k for k, v in folds[0]["metrics"].items() if np.ndim(v) == 0 and not isinstance(v, str)
+    ]
+    values = {k: np.array([f["metrics"][k] for f in folds], dtype=float) for k in names}
+    return (
+        {k: float(v.mean()) for k, v in values.items()},
+        {k: float(v.std(ddof=1)) if len(v) > 1 else 0.0 for k, v in values.items()},
+    )
+
+
+class _ProbaModel:
+    """
+    Готовые прогнозы в интерфейсе модели — для _evaluate_* тренеров.
+    """
+
+    def __init__(self, pred: np.ndarray) -> None:
+        self.pred = pred
+
+    def predict(self, X) -> np.ndarray:
+        return self.pred
+
+    def predict_proba(self, X) -> np.ndarray:
+        return np.column_stack([1 - self.pred, self.pred])
+
+
+def resolve_split(
+    target: str,
+    split: str = "auto",
+    group_column: Optional[str] = None,
+    time_column: Optional[str] = None,
+) -> str:
+    """
+    Способ разбиения с проверкой аргументов. "auto" — time, если задан
+    time_column, group — если group_column, иначе stratified для риска
+    и kfold для маржи. Колонка при несовместимом split — ValueError
+    (а не молчаливое игнорирование).
+    """
+    if target not in TARGETS:
+        raise ValueError(f"Неизвестная цель: {target}")
+    if split == "auto":
+        if time_column and group_column:
+            raise ValueError("Заданы и time_column, и group_column: укажите split явно")
+        if time_column:
+            split = "time"
+        elif group_column:
+            split = "group"
+        else:
+            split = "stratified" if target == "risk" else "kfold"
+    if split not in SPLITS:
+        raise ValueError(f"Неизвестный способ разбиения: {split}")
+    if time_column and split != "time":
+        raise ValueError(f"time_column задан, но split={split!r} (нужен 'time' или 'auto')")
+    if group_column and split != "group":
+        raise ValueError(f"group_column задан, но split={split!r} (нужен 'group' или 'auto')")
+    return split
+
+
+def cross_validate(
+    data_path: str = DATA_PATH,
+    target: str = "margin",
+    n_splits: int = DEFAULT_N_SPLITS,
+    split: str = "auto",
+    group_column: Optional[str] = None,
+    time_column: Optional[str] = None,
+    params: Optional[Dict[str, Any]] = None,
+    n_workers: Optional[int] = None,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """
+    k-fold кросс-валидация модели маржи (target="margin") или риска ("risk").
+
+    split: "auto" (см. resolve_split); "group" — GroupKFold по group_column;
+    "time" — расширяющееся окно по time_column (по умолчанию — порядок
+    строк в наборе).
+
+    Фолды обучаются параллельно в n_workers процессах (XGBoost в каждом —
+    ядра / n_workers потоков) над одной копией матрицы в shared_memory.
+    params — гиперпараметры модели (по умолчанию — как в тренерах).
+
+    Возвращает:
+    - folds — метрики каждого фолда (как у тренеров) и размеры выборок,
+    - mean / std — агрегаты числовых метрик по фолдам,
+    - oof — out-of-fold прогнозы (вероятности для риска); NaN у строк,
+      не попавших ни в один тест (блок 0 при split="time"),
+    - oof_metrics — метрики по всем out-of-fold прогнозам сразу.
+    """
+    from .dataset import load_dataset, load_feature_matrix
+    from .features import CATEGORICAL_COLUMNS, fit_category_vocabulary
+    from .train_classifier import _evaluate_classifier
+    from .train_regressor import _evaluate_regressor
+
+    split = resolve_split(target, split, group_column, time_column)
+
+    extra = [c for c in (group_column, time_column) if c and c not in CATEGORICAL_COLUMNS]
+    with span("cv.load") as s:
+        df = load_dataset(data_path, columns=CATEGORICAL_COLUMNS + [TARGETS[target]] + extra)
+        X = np.asarray(load_feature_matrix(data_path, fit_category_vocabulary(df)))
+        y = df[TARGETS[target]].to_numpy()
+        s.rows = len(y)
+
+    folds = assign_folds(
+        n_splits,
+        split,
+        y,
+        groups=df[group_column].to_numpy() if group_column else None,
+        order=df[time_column].to_numpy() if time_column else None,
+        seed=seed,
+    )
+    test_folds = range(1, n_splits + 1) if split == "time" else range(n_splits)
+
+    if n_workers is None:
+        n_workers = min(n_splits, os.cpu_count() or 1)
+    n_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+
+    shm, layout = _to_shared({"X": X, "y": y, "folds": folds})
+    try:
+        context = multiprocessing.get_context("spawn")
+        with span("cv.folds", rows=len(y), folds=n_splits, split=split):
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as pool:
+                futures = [
+                    pool.submit(_fit_fold, shm.name, layout, target, k, split == "time", params, n_jobs)
+                    for k in test_folds
+                ]
+                results = [f.result() for f in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    oof = np.full(len(y), np.nan, dtype=np.float32)
+    for r in results:
+        oof[folds == r["fold"]] = r.pop("pred")
+    tested = ~np.isnan(oof)
+
+    if target == "risk":
+        oof_metrics = _evaluate_classifier(_ProbaModel(oof[tested]), None, y[tested])
+    else:
+        oof_metrics = _evaluate_regressor(_ProbaModel(oof[tested]), None, y[tested])
+
+    mean, std = _aggregate(results)
+    return {
+        "target": target,
+        "split": split,
+        "n_splits": n_splits,
+        "folds": results,
+        "mean": mean,
+        "std": std,
+        "oof": oof,
+        "oof_metrics": oof_metrics,
+    }
+
+
+def cv_metrics(
+    data_path: str,
+    target: str,
+    n_splits: int,
+    split: str = "auto",
+    params: Optional[Dict[str, Any]] = None,
+    group_column: Optional[str] = None,
+    time_column: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Краткий итог кросс-валидации для метрик тренеров (и реестра):
+    агрегаты и числовые метрики каждого фолда, без OOF-прогнозов.
+    group_column / time_column — для split="group" / "time".
+    """
+    result = cross_validate(
+        data_path,
+        target,
+        n_splits=n_splits,
+        split=split,
+        group_column=group_column,
+        time_column=time_column,
+        params=params,
+    )
+    print(format_summary(result))
+    return {
+        "split": result["split"],
+        "n_splits": result["n_splits"],
+        "mean": result["mean"],
+        "std": result["std"],
+        "folds": [{k: f["metrics"][k] for k in result["mean"]} for f in result["folds"]],
+    }
+
+
+def format_summary(result: Dict[str, Any]) -> str:
+    lines = [f"CV {result['target']} ({result['split']}, {result['n_splits']} фолдов)"]
+    for name, value in result["mean"].items():
+        lines.append(f"  {name}: {value:.4f} ± {result['std'][name]:.4f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Кросс-валидация моделей маржи и риска")
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument("--n-splits", type=int, default=DEFAULT_N_SPLITS)
+    parser.add_argument("--split", default="auto", choices=SPLITS)
+    parser.add_argument("--group-column", default=None)
+    parser.add_argument("--time-column", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    for target in args.targets:
+        result = cross_validate(
+            args.data_path,
+            target,
+            n_splits=args.n_splits,
+            split=args.split,
+            group_column=args.group_column,
+            time_column=args.time_column,
+            n_workers=args.workers,
+        )
+        print(format_summary(result))
+        for fold in result["folds"]:
+            scores = ", ".join(
+                f"{k}={fold['metrics'][k]:.4f}" for k in result["mean"]
+            )
+            print(f"    fold {fold['fold']}: {scores} (train {fold['n_train']}, test {fold['n_test']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,70 @@
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, Optional
+
 import numpy as np
 import pandas as pd
 from pathlib import Path
 
+from .profiling import span
 
-def generate_data(
-    output_path: str = "data/raw/synthetic_construction_projects.csv",
-    n_projects: int = 6000,
-    seed: int = 42,
-    material_price_range=(0.9, 1.1),
-    mortgage_rate_range=(7.0, 12.0),
-    market_demand_range=(0.8, 1.2),
-    labor_cost_range=(0.9, 1.2),
-) -> None:
-    """
-    Генерация синтетических проектов строительства с возможностью
-    менять параметры рынка.
-    """
-    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
 
-    np.random.seed(seed)
+DISTRICT_CLASSES = np.array(["econom", "standard", "premium"])
+MATERIALS_CLASSES = np.array(["econom", "standard", "premium"])
+WEATHER_SEASONS = np.array(["winter", "spring", "summer", "autumn"])
+CLIENT_TYPES = np.array(["private", "commercial"])
+
+# Диапазоны цены земли по классу района (верхняя граница не включается)
+LAND_PRICE_LOW = np.array([3000, 6000, 15000])
+LAND_PRICE_HIGH = np.array([5001, 12001, 25001])
+MATERIALS_MULTIPLIERS = np.array([0.8, 1.0, 1.3])
+WEATHER_FACTORS = np.array([5, 2, 1, 3])
+
+# Диапазоны рыночных параметров по умолчанию (равномерное распределение)
+MATERIAL_PRICE_RANGE = (0.9, 1.1)
+MORTGAGE_RATE_RANGE = (7.0, 12.0)
+MARKET_DEMAND_RANGE = (0.8, 1.2)
+LABOR_COST_RANGE = (0.9, 1.2)
+
+# Единица случайности: каждый блок строк генерируется из своего подпотока
+# SeedSequence(seed).spawn(...), поэтому результат не зависит от chunk_size
+BLOCK_SIZE = 65_536
+DEFAULT_CHUNK_SIZE = 262_144
 
-    N = n_projects
 
+def _generate_frame(
+    N: int,
+    rng: np.random.Generator,
+    material_price_range=MATERIAL_PRICE_RANGE,
+    mortgage_rate_range=MORTGAGE_RATE_RANGE,
+    market_demand_range=MARKET_DEMAND_RANGE,
+    labor_cost_range=LABOR_COST_RANGE,
+) -> pd.DataFrame:
+    """
+    Векторизованная генерация N проектов из генератора rng.
+    Случайные величины извлекаются в фиксированном порядке (по разделам ниже),
+    поэтому результат полностью определяется состоянием rng.
+    """
     # 1. District / Land
-    district_class = np.random.choice(
-        ["econom", "standard", "premium"], size=N, p=[0.5, 0.4, 0.1]
+    district_codes = rng.choice(3, size=N, p=[0.5, 0.4, 0.1])
+    land_price_per_m2 = rng.integers(
+        LAND_PRICE_LOW[district_codes], LAND_PRICE_HIGH[district_codes]
     )
-    land_price_per_m2 = np.array(
-        [
-            np.random.randint(3000, 5001)
-            if d == "econom"
-            else np.random.randint(6000, 12001)
-            if d == "standard"
-            else np.random.randint(15000, 25001)
-            for d in district_class
-        ]
-    )
-    soil_complexity = np.random.randint(1, 6, N)
-    site_accessibility = np.random.randint(1, 6, N)
-    land_area_m2 = np.random.randint(400, 1001, N)
+    soil_complexity = rng.integers(1, 6, N)
+    site_accessibility = rng.integers(1, 6, N)
+    land_area_m2 = rng.integers(400, 1001, N)
 
     # 2. House / Project
-    house_area_m2 = np.random.normal(150, 50, N).clip(80, 350)
-    design_complexity = np.random.randint(1, 6, N)
-    materials_class = np.random.choice(
-        ["econom", "standard", "premium"], size=N, p=[0.4, 0.4, 0.2]
-    )
+    house_area_m2 = rng.normal(150, 50, N).clip(80, 350)
+    design_complexity = rng.integers(1, 6, N)
+    materials_codes = rng.choice(3, size=N, p=[0.4, 0.4, 0.2])
     planned_duration_days = (house_area_m2 / 150 * 90 + design_complexity * 10).astype(
         int
     )
     base_cost_per_m2 = 50000
 
-    materials_multiplier = np.array(
-        [
-            0.8 if m == "econom" else 1.0 if m == "standard" else 1.3
-            for m in materials_class
-        ]
-    )
+    materials_multiplier = MATERIALS_MULTIPLIERS[materials_codes]
     planned_budget = (
         house_area_m2 * base_cost_per_m2 * materials_multiplier
         + design_complexity * 50000
@@ -64,44 +72,39 @@ def generate_data(
     )
 
     # 3. Construction (включая скрытое качество управления)
-    crew_experience_years = np.random.randint(1, 11, N)
+    crew_experience_years = rng.integers(1, 11, N)
     crew_efficiency_score = np.clip(
-        np.random.normal(0.8 + crew_experience_years / 50, 0.05, N), 0.7, 1.0
+        rng.normal(0.8 + crew_experience_years / 50, 0.05, N), 0.7, 1.0
     )
-    crew_current_load = np.random.randint(0, 4, N)
+    crew_current_load = rng.integers(0, 4, N)
     supplier_reliability_score = np.clip(
-        np.random.normal(0.9, 0.05, N), 0.7, 1.0
+        rng.normal(0.9, 0.05, N), 0.7, 1.0
     )
     # Скрытый фактор управления проектом (не попадает в фичи)
-    management_quality = np.random.randint(1, 6, N)  # 1 = плохо, 5 = отлично
-    delivery_distance_km = np.random.randint(5, 51, N)
-    weather_season = np.random.choice(["winter", "spring", "summer", "autumn"], N)
-
-    weather_factor = np.array(
-        [
-            5 if w == "winter" else 2 if w == "spring" else 1 if w == "summer" else 3
-            for w in weather_season
-        ]
-    )
+    management_quality = rng.integers(1, 6, N)  # 1 = плохо, 5 = отлично
+    delivery_distance_km = rng.integers(5, 51, N)
+    weather_codes = rng.integers(0, 4, N)
+
+    weather_factor = WEATHER_FACTORS[weather_codes]
 
     # 4. External / Market (управляемые параметры рынка + неожиданные события)
-    material_price_index = np.random.uniform(
+    material_price_index = rng.uniform(
         material_price_range[0], material_price_range[1], N
     )
-    mortgage_rate = np.random.uniform(
+    mortgage_rate = rng.uniform(
         mortgage_rate_range[0], mortgage_rate_range[1], N
     )
-    market_demand_index = np.random.uniform(
+    market_demand_index = rng.uniform(
         market_demand_range[0], market_demand_range[1], N
     )
-    labor_cost_index = np.random.uniform(
+    labor_cost_index = rng.uniform(
         labor_cost_range[0], labor_cost_range[1], N
     )
     # Скрытый индекс неожиданных событий (force majeurs)
-    unexpected_events_index = np.random.exponential(scale=0.4, size=N)
+    unexpected_events_index = rng.exponential(scale=0.4, size=N)
     unexpected_events_index = np.clip(unexpected_events_index, 0, 2.0)
 
-    client_type = np.random.choice(["private", "commercial"], size=N, p=[0.7, 0.3])
+    client_codes = rng.choice(2, size=N, p=[0.7, 0.3])
 
     # 5. Calculate delays (с учётом управления и неожиданных событий)
     delay_days = (
@@ -112,7 +115,7 @@ def generate_data(
         + weather_factor
         + (6 - management_quality) * 3.0
         + unexpected_events_index * 6.0
-        + np.random.normal(0, 5, N)
+        + rng.normal(0, 5, N)
     ).clip(0, None)
 
     # 6. Actual cost (доп. влияние неожиданных событий и стоимости труда)
@@ -125,7 +128,7 @@ def generate_data(
     actual_cost *= 1 + 0.04 * labor_centered
 
     penalty_cost = np.zeros(N)
-    penalty_mask = (client_type == "commercial") & (
+    penalty_mask = (client_codes == 1) & (
         delay_days > planned_duration_days * 1.1
     )
     penalty_cost[penalty_mask] = (
@@ -151,23 +154,23 @@ def generate_data(
         + 0.01 * delivery_centered
         + 0.3 * weather_centered
         + 0.4 * material_centered
-        + np.random.normal(0, 0.8, N)
+        + rng.normal(0, 0.8, N)
     )
     prob_overrun = 1 / (1 + np.exp(-logit))
-    budget_overrun = (np.random.rand(N) < prob_overrun).astype(int)
+    budget_overrun = (rng.random(N) < prob_overrun).astype(int)
     final_profit = planned_budget - actual_cost
 
     # 8. Create DataFrame
     df = pd.DataFrame(
         {
-            "district_class": district_class,
+            "district_class": pd.Categorical.from_codes(district_codes, DISTRICT_CLASSES),
             "land_price_per_m2": land_price_per_m2,
             "soil_complexity": soil_complexity,
             "site_accessibility": site_accessibility,
             "land_area_m2": land_area_m2,
             "house_area_m2": house_area_m2,
             "design_complexity": design_complexity,
-            "materials_class": materials_class,
+            "materials_class": pd.Categorical.from_codes(materials_codes, MATERIALS_CLASSES),
             "planned_duration_days": planned_duration_days,
             "planned_budget": planned_budget,
             "crew_experience_years": crew_experience_years,
@@ -175,21 +178,194 @@ def generate_data(
             "crew_current_load": crew_current_load,
             "supplier_reliability_score": supplier_reliability_score,
             "delivery_distance_km": delivery_distance_km,
-            "weather_season": weather_season,
+            "weather_season": pd.Categorical.from_codes(weather_codes, WEATHER_SEASONS),
             "material_price_index": material_price_index,
             "mortgage_rate": mortgage_rate,
             "market_demand_index": market_demand_index,
-            "client_type": client_type,
+            "client_type": pd.Categorical.from_codes(client_codes, CLIENT_TYPES),
             "labor_cost_index": labor_cost_index,
             "delay_days": delay_days,
             "actual_cost": actual_cost,
             "actual_margin": actual_margin,
             "budget_overrun": budget_overrun,
             "final_profit": final_profit,
-        }
+        },
+        copy=False,
     )
 
-    df.to_csv(output_path, index=False)
-    print(f"{N} проектов сгенерированы и сохранены в '{output_path}'")
+    return df
+
+
+def iter_blocks(
+    n_projects: int,
+    seed: int = 42,
+    start_block: int = 0,
+    stop_block: Optional[int] = None,
+    **market_ranges,
+) -> Iterator[pd.DataFrame]:
+    """
+    Блоки по BLOCK_SIZE проектов (последний может быть короче).
+    Блок i генерируется из i-го дочернего потока SeedSequence(seed).spawn(...)
+    и не зависит от остальных блоков.
+    """
+    n_blocks = -(-n_projects // BLOCK_SIZE)
+    stop_block = n_blocks if stop_block is None else min(stop_block, n_blocks)
+    children = np.random.SeedSequence(seed).spawn(n_blocks)
+    for block in range(start_block, stop_block):
+        n = min(BLOCK_SIZE, n_projects - block * BLOCK_SIZE)
+        yield _generate_frame(n, np.random.default_rng(children[block]), **market_ranges)
+
+
+def iter_chunks(
+    n_projects: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    seed: int = 42,
+    start_block: int = 0,
+    stop_block: Optional[int] = None,
+    **market_ranges,
+) -> Iterator[pd.DataFrame]:
+    """
+    Потоковая генерация: куски по chunk_size строк из блоков
+    [start_block, stop_block). В памяти одновременно не больше
+    chunk_size + BLOCK_SIZE строк при любом n_projects.
+    """
+    buffer = []
+    buffered = 0
+    blocks = iter_blocks(n_projects, seed, start_block, stop_block, **market_ranges)
+    for block in blocks:
+        buffer.append(block)
+        buffered += len(block)
+        while buffered >= chunk_size:
+            merged = pd.concat(buffer, ignore_index=True)
+            yield merged.iloc[:chunk_size]
+            rest = merged.iloc[chunk_size:]
+            buffer = [rest] if len(rest) else []
+            buffered = len(rest)
+    if buffered:
+        yield pd.concat(buffer, ignore_index=True)
+
+
+def _resolve_format(output_path: str, output_format: Optional[str]) -> str:
+    if output_format:
+        return output_format
+    return "parquet" if Path(output_path).suffix in ("", ".parquet") else "csv"
+
+
+def _write_partition(
+    output_path: str,
+    output_format: str,
+    part_index: int,
+    n_projects: int,
+    seed: int,
+    start_block: int,
+    stop_block: int,
+    chunk_size: int,
+    market_ranges: Dict[str, Any],
+) -> int:
+    """
+    Пишет одну партицию (диапазон блоков) потоково:
+    - csv: файл <output_path>.part<NNN>, заголовок только у партиции 0,
+    - parquet: файлы <output_path>/part-<NNN>-<MMMMM>.parquet.
+    Партиция 0 всегда задаёт схему (заголовок CSV / пустой Parquet-файл),
+    даже если строк нет (n_projects=0).
+    Возвращает число записанных строк.
+    """
+    chunks = iter_chunks(
+        n_projects, chunk_size, seed, start_block, stop_block, **market_ranges
+    )
+    # Пустой кадр с колонками и типами генератора
+    empty = _generate_frame(0, np.random.default_rng(seed), **market_ranges)
+    total = 0
+    if output_format == "csv":
+        with open(f"{output_path}.part{part_index:03d}", "w", newline="", encoding="utf-8") as f:
+            if part_index == 0:
+                empty.to_csv(f, index=False)
+            for chunk in chunks:
+                chunk.to_csv(f, header=False, index=False)
+                total += len(chunk)
+    elif output_format == "parquet":
+        out_dir = Path(output_path)
+        for i, chunk in enumerate(chunks):
+            chunk.to_parquet(out_dir / f"part-{part_index:03d}-{i:05d}.parquet", index=False)
+            total += len(chunk)
+        if part_index == 0 and total == 0:
+            empty.to_parquet(out_dir / f"part-{part_index:03d}-00000.parquet", index=False)
+    else:
+        raise ValueError(f"Неизвестный формат вывода: {output_format}")
+    return total
+
+
+def generate_data(
+    output_path: str = "data/raw/synthetic_construction_projects.csv",
+    n_projects: int = 6000,
+    seed: int = 42,
+    material_price_range=MATERIAL_PRICE_RANGE,
+    mortgage_rate_range=MORTGAGE_RATE_RANGE,
+    market_demand_range=MARKET_DEMAND_RANGE,
+    labor_cost_range=LABOR_COST_RANGE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    output_format: Optional[str] = None,
+    n_workers: int = 1,
+) -> None:
+    """
+    Генерация синтетических проектов строительства с возможностью
+    менять параметры рынка.
+
+    Данные генерируются и записываются потоково кусками по chunk_size строк,
+    поэтому пиковая память не зависит от n_projects. Формат вывода:
+    "csv" (один файл) или "parquet" (каталог part-*.parquet); по умолчанию
+    определяется по расширению output_path.
+
+    При n_workers > 1 блоки делятся на n_workers непрерывных диапазонов,
+    каждый процесс пула получает дочерние потоки своих блоков и пишет
+    свою партицию; CSV-партиции затем склеиваются по порядку.
+
+    Воспроизводимость: при одинаковых seed, n_projects и диапазонах рынка
+    результат идентичен при любых chunk_size и n_workers. Блок строк i (по BLOCK_SIZE)
+    генерируется из i-го дочернего потока np.random.SeedSequence(seed).spawn(...)
+    в фиксированном порядке колонок; глобальное состояние np.random
+    не используется и не меняется. Поток генератора может измениться
+    только со сменой версии NumPy (см. политику совместимости NumPy).
+    """
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+    output_format = _resolve_format(output_path, output_format)
+    market_ranges = {
+        "material_price_range": material_price_range,
+        "mortgage_rate_range": mortgage_rate_range,
+        "market_demand_range": market_demand_range,
+        "labor_cost_range": labor_cost_range,
+    }
+    if output_format == "parquet":
+        Path(output_path).mkdir(parents=True, exist_ok=True)
+        for old in Path(output_path).glob("part-*.parquet"):
+            old.unlink()
+
+    n_blocks = -(-n_projects // BLOCK_SIZE)
+    n_workers = max(1, min(n_workers, n_blocks))
+    bounds = np.linspace(0, n_blocks, n_workers + 1).astype(int)
+    jobs = [
+        (output_path, output_format, w, n_projects, seed, bounds[w], bounds[w + 1], chunk_size, market_ranges)
+        for w in range(n_workers)
+    ]
+    with span("generate.partitions", rows=n_projects, workers=n_workers, format=output_format):
+        if n_workers == 1:
+            for job in jobs:
+                _write_partition(*job)
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                list(pool.map(_write_partition, *zip(*jobs)))
 
+    if output_format == "csv":
+        # Склейка партиций и атомарная замена итогового файла
+        with span("generate.concat", rows=n_projects):
+            tmp_path = f"{output_path}.tmp"
+            with open(tmp_path, "wb") as out:
+                for w in range(n_workers):
+                    part_path = f"{output_path}.part{w:03d}"
+                    with open(part_path, "rb") as part:
+                        shutil.copyfileobj(part, out, 1 << 20)
+                    os.remove(part_path)
+            os.replace(tmp_path, output_path)
 
+    print(f"{n_projects} проектов сгенерированы и сохранены в '{output_path}'")
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as pa_ds
+import pyarrow.feather as feather
+
+from .features import FEATURE_COLUMNS, Vocabulary, encode_features
+from .profiling import span
+
+
+DEFAULT_DATA_PATH = "data/raw/synthetic_construction_projects.csv"
+DEFAULT_CACHE_DIR = "data/cache"
+ENCODE_BATCH_ROWS = 262_144
+
+
+def _source_files(data_path: str) -> List[Path]:
+    """
+    Файлы источника: сам CSV/Parquet или part-*.parquet каталога.
+    """
+    path = Path(data_path)
+    if path.is_dir():
+        return sorted(path.glob("*.parquet"))
+    return [path]
+
+
+def _is_parquet(data_path: str) -> bool:
+    path = Path(data_path)
+    return path.is_dir() or path.suffix == ".parquet"
+
+
+def _stat_signature(data_path: str) -> List[List[Any]]:
+    return [[f.name, f.stat().st_size, f.stat().st_mtime_ns] for f in _source_files(data_path)]
+
+
+def _content_hash(data_path: str) -> str:
+    h = hashlib.sha256()
+    for f in _source_files(data_path):
+        h.update(f.name.encode())
+        with open(f, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def _tmp_path(path: Path) -> Path:
+    """
+    Уникальный временный файл рядом с path (для os.replace): кэш может
+    заполняться параллельно из нескольких потоков одного процесса.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+    os.close(fd)
+    return Path(tmp)
+
+
+class _CacheEntry:
+    """
+    Кэш одного источника: <cache_dir>/<stem>-<hash пути>.*
+    Мета-файл хранит подпись источника (размер, mtime) и sha256 содержимого.
+    """
+
+    def __init__(self, data_path: str, cache_dir: str) -> None:
+        self.data_path = data_path
+        abs_path = os.path.abspath(data_path)
+        tag = hashlib.sha256(abs_path.encode()).hexdigest()[:8]
+        self.prefix = Path(cache_dir) / f"{Path(abs_path).stem}-{tag}"
+        self.meta_path = self.prefix.with_name(self.prefix.name + ".meta.json")
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, meta: Dict[str, Any]) -> None:
+        tmp = _tmp_path(self.meta_path)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def source_hash(self) -> str:
+        """
+        sha256 источника. Пересчитывается только если изменились
+        размер/mtime; если содержимое не изменилось, кэш остаётся валидным.
+        """
+        self.prefix.parent.mkdir(parents=True, exist_ok=True)
+        signature = _stat_signature(self.data_path)
+        meta = self._read_meta()
+        if meta and meta.get("signature") == signature:
+            return meta["sha256"]
+
+        digest = _content_hash(self.data_path)
+        if meta and meta.get("sha256") != digest:
+            # Источник изменился — старые файлы кэша больше не нужны
+            for old in self.prefix.parent.glob(f"{self.prefix.name}-{meta['sha256'][:16]}*"):
+                old.unlink(missing_ok=True)
+        self._write_meta({"source": os.path.abspath(self.data_path), "signature": signature, "sha256": digest})
+        return digest
+
+    def path(self, digest: str, suffix: str) -> Path:
+        return self.prefix.with_name(f"{self.prefix.name}-{digest[:16]}{suffix}")
+
+
+def _to_feather(data_path: str, out_path: Path) -> None:
+    """
+    Потоковая конвертация CSV/Parquet -> Feather (Arrow IPC)
+    без загрузки всего источника в память.
+    """
+    tmp = _tmp_path(out_path)
+    with span("dataset.to_feather", source=str(data_path)) as s:
+        if _is_parquet(data_path):
+            source = pa_ds.dataset(data_path, format="parquet")
+            schema, batches = source.schema, source.to_batches()
+        else:
+            reader = pa_csv.open_csv(data_path)
+            schema, batches = reader.schema, reader
+        s.rows = 0
+        with pa.ipc.new_file(str(tmp), schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                s.rows += batch.num_rows
+        os.replace(tmp, out_path)
+
+
+def dataset_hash(data_path: str = DEFAULT_DATA_PATH, cache_dir: str = DEFAULT_CACHE_DIR) -> str:
+    """
+    sha256 содержимого источника (с кэшированием по размеру/mtime).
+    """
+    return _CacheEntry(data_path, cache_dir).source_hash()
+
+
+def file_sha256(path: str) -> str:
+    """
+    sha256 содержимого одного файла (модели, словаря категорий).
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_signature(path: str, with_hash: bool = False) -> Tuple[Any, ...]:
+    """
+    Подпись файла для проверки актуальности: (mtime_ns, size[, sha256]).
+    """
+    st = os.stat(path)
+    if not with_hash:
+        return st.st_mtime_ns, st.st_size
+    return st.st_mtime_ns, st.st_size, file_sha256(path)
+
+
+def load_table(
+    data_path: str = DEFAULT_DATA_PATH,
+    columns: Optional[List[str]] = None,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+) -> pa.Table:
+    """
+    Arrow-таблица набора данных. Источник (CSV или Parquet) один раз
+    конвертируется в Feather и дальше читается через memory map.
+    """
+    entry = _CacheEntry(data_path, cache_dir)
+    cache_path = entry.path(entry.source_hash(), ".feather")
+    if not cache_path.exists():
+        _to_feather(data_path, cache_path)
+    return feather.read_table(str(cache_path), columns=columns, memory_map=True)
+
+
+def load_dataset(
+    data_path: str = DEFAULT_DATA_PATH,
+    columns: Optional[List[str]] = None,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+) -> pd.DataFrame:
+    """
+    DataFrame набора данных из бинарного кэша (замена pd.read_csv).
+    """
+    return load_table(data_path, columns, cache_dir).to_pandas(split_blocks=True)
+
+
+def load_feature_matrix(
+    data_path: str,
+    vocabulary: Vocabulary,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+) -> np.ndarray:
+    """
+    Закодированная матрица FEATURE_COLUMNS (float32) как memory-mapped .npy.
+    Ключ кэша — содержимое источника и словарь категорий.
+    """
+    entry = _CacheEntry(data_path, cache_dir)
+    digest = entry.source_hash()
+    vocab_hash = hashlib.sha256(json.dumps(vocabulary, sort_keys=True).encode()).hexdigest()[:16]
+    cache_path = entry.path(digest, f"-X-{vocab_hash}.npy")
+
+    if not cache_path.exists():
+        # Кодирование по батчам Arrow прямо в .npy на диске
+        table = load_table(data_path, cache_dir=cache_dir)
+        with span("dataset.encode_features", rows=table.num_rows):
+            tmp = _tmp_path(cache_path)
+            X = np.lib.format.open_memmap(
+                tmp, mode="w+", dtype=np.float32, shape=(table.num_rows, len(FEATURE_COLUMNS))
+            )
+            start = 0
+            for batch in table.to_batches(max_chunksize=ENCODE_BATCH_ROWS):
+                X[start : start + batch.num_rows] = encode_features(batch.to_pandas(), vocabulary)
+                start += batch.num_rows
+            X.flush()
+            del X
+            os.replace(tmp, cache_path)
+
+    return np.load(cache_path, mmap_mode="r")
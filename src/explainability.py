@@ -1,71 +1,200 @@
-import joblib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
 import pandas as pd
-import shap
-import plotly.express as px
 
-from .train_regressor import FEATURE_COLUMNS, _encode_categories
+# shap, matplotlib и plotly импортируются только при построении графиков:
+# compute_explanations (веб-приложение, пакетные задачи) обходится без них
+from .dataset import load_dataset, load_feature_matrix
+from .features import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, resolve_vocabulary, vocabulary_path_for
+from .profiling import span
+from .registry import load_model_for_path
+from .shap_cache import compute_shap_values
 
 
-def explain_margin(
+def _shap_explanation(data_path: str, model_path: str, sample_size: int):
+    """
+    SHAP-значения из кэша (TreeSHAP по всему набору) + выборка проектов
+    для графиков.
+    """
+    df = load_dataset(data_path, columns=CATEGORICAL_COLUMNS)
+    vocabulary = resolve_vocabulary(df, vocabulary_path_for(model_path))
+    X_all = load_feature_matrix(data_path, vocabulary)
+    shap_result = compute_shap_values(model_path, data_path)
+
+    idx = np.arange(len(X_all))
+    if sample_size and len(idx) > sample_size:
+        idx = np.sort(np.random.default_rng(42).choice(idx, sample_size, replace=False))
+
+    import shap
+
+    X = pd.DataFrame(np.asarray(X_all[idx]), columns=FEATURE_COLUMNS, index=idx)
+    shap_values = shap.Explanation(
+        values=np.asarray(shap_result["values"][idx]),
+        base_values=np.asarray(shap_result["base_values"][idx]),
+        data=X.to_numpy(),
+        feature_names=FEATURE_COLUMNS,
+    )
+    return X, shap_values
+
+
+def compute_explanations(
+    model_path: str,
     data_path: str = "data/raw/synthetic_construction_projects.csv",
-    model_path: str = "models/margin_model.pkl",
-    sample_size: int = 500,
-) -> None:
+    top_k: int = 5,
+) -> Dict[str, Any]:
     """
-    SHAP summary + feature importance + локальные объяснения для модели маржи.
+    Объяснения без графиков (для пакетных задач и веб-приложения):
+    - importance — глобальная важность (среднее |SHAP|) по признакам,
+    - top_features / top_shap — для каждого проекта top_k признаков
+      с наибольшим |SHAP| (индексы в feature_names и значения),
+    - shap_values / base_values — полная SHAP-матрица по всем проектам.
     """
-    df = pd.read_csv(data_path)
-    df_enc = _encode_categories(df)
+    with span("explain.shap_values"):
+        result = compute_shap_values(model_path, data_path)
+    values = np.asarray(result["values"])
+    top_k = min(top_k, values.shape[1])
 
-    model = joblib.load(model_path)
+    importance = pd.DataFrame(
+        {"feature": FEATURE_COLUMNS, "mean_abs_shap": np.abs(values).mean(axis=0)}
+    ).sort_values(by="mean_abs_shap", ascending=False, ignore_index=True)
 
-    X = df_enc[FEATURE_COLUMNS]
-    if sample_size and len(X) > sample_size:
-        X = X.sample(sample_size, random_state=42)
+    abs_values = np.abs(values)
+    top = np.argpartition(-abs_values, top_k - 1, axis=1)[:, :top_k]
+    order = np.argsort(-np.take_along_axis(abs_values, top, axis=1), axis=1)
+    top_features = np.take_along_axis(top, order, axis=1).astype(np.int16)
 
-    explainer = shap.Explainer(model)
-    shap_values = explainer(X)
+    return {
+        "importance": importance,
+        "top_features": top_features,
+        "top_shap": np.take_along_axis(values, top_features.astype(np.intp), axis=1),
+        "shap_values": values,
+        "base_values": np.asarray(result["base_values"]),
+        "feature_names": list(FEATURE_COLUMNS),
+    }
 
-    # SHAP summary (global)
-    shap.summary_plot(shap_values, X, plot_type="bar")
 
-    # Feature importance (по среднему абсолютному SHAP)
-    shap.summary_plot(shap_values, X)
+def project_contributions(explanations: Dict[str, Any], project_index: int) -> pd.DataFrame:
+    """
+    Top-k вкладов признаков для одного проекта.
+    """
+    names = np.asarray(explanations["feature_names"])
+    return pd.DataFrame(
+        {
+            "feature": names[explanations["top_features"][project_index]],
+            "shap": explanations["top_shap"][project_index],
+        }
+    )
 
-    # Local explanations для первых нескольких проектов
-    for i in range(min(3, len(X))):
-        shap.plots.waterfall(shap_values[i], max_display=10)
 
+def save_explanations(explanations: Dict[str, Any], path: str) -> None:
+    """
+    Сохранение предрасчитанных объяснений (например, ночной задачей).
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    importance = explanations["importance"]
+    np.savez(
+        path,
+        importance_feature=importance["feature"].to_numpy(dtype=str),
+        importance_value=importance["mean_abs_shap"].to_numpy(),
+        top_features=explanations["top_features"],
+        top_shap=explanations["top_shap"],
+        shap_values=explanations["shap_values"],
+        base_values=explanations["base_values"],
+        feature_names=np.asarray(explanations["feature_names"], dtype=str),
+    )
 
-def explain_risk(
-    data_path: str = "data/raw/synthetic_construction_projects.csv",
-    model_path: str = "models/risk_model.pkl",
-    sample_size: int = 500,
-) -> None:
+
+def load_explanations(path: str) -> Dict[str, Any]:
+    with np.load(path) as data:
+        return {
+            "importance": pd.DataFrame(
+                {"feature": data["importance_feature"], "mean_abs_shap": data["importance_value"]}
+            ),
+            "top_features": data["top_features"],
+            "top_shap": data["top_shap"],
+            "shap_values": data["shap_values"],
+            "base_values": data["base_values"],
+            "feature_names": data["feature_names"].tolist(),
+        }
+
+
+def _render(name: str, output_dir: Optional[str], saved: List[str]) -> None:
     """
-    SHAP summary + feature importance + локальные объяснения для модели риска.
+    Показ текущей matplotlib-фигуры или сохранение её в output_dir
+    (графики shap строятся с show=False — решает только _render).
     """
-    df = pd.read_csv(data_path)
-    df_enc = _encode_categories(df)
+    import matplotlib.pyplot as plt
+
+    if output_dir is None:
+        plt.show()
+    else:
+        path = Path(output_dir) / f"{name}.png"
+        plt.savefig(path, bbox_inches="tight", dpi=120)
+        saved.append(str(path))
+    plt.close("all")
 
-    model = joblib.load(model_path)
 
-    X = df_enc[FEATURE_COLUMNS]
-    if sample_size and len(X) > sample_size:
-        X = X.sample(sample_size, random_state=42)
+def _plot_shap(X: pd.DataFrame, shap_values, prefix: str, output_dir: Optional[str]) -> List[str]:
+    import shap
 
-    explainer = shap.Explainer(model, X)
-    shap_values = explainer(X)
+    saved: List[str] = []
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-    # SHAP summary + глобальное влияние
-    shap.summary_plot(shap_values, X, plot_type="bar")
-    shap.summary_plot(shap_values, X)
+    # SHAP summary (global) + распределение вкладов
+    with span(f"explain.{prefix}.summary_plots", rows=len(X)):
+        shap.summary_plot(shap_values, X, plot_type="bar", show=False)
+        _render(f"{prefix}_summary_bar", output_dir, saved)
+        shap.summary_plot(shap_values, X, show=False)
+        _render(f"{prefix}_summary", output_dir, saved)
 
-    # Локальные объяснения
-    for i in range(min(3, len(X))):
-        shap.plots.waterfall(shap_values[i], max_display=10)
+    # Локальные объяснения для первых нескольких проектов
+    with span(f"explain.{prefix}.waterfall_plots"):
+        for i in range(min(3, len(X))):
+            shap.plots.waterfall(shap_values[i], max_display=10, show=False)
+            _render(f"{prefix}_waterfall_{X.index[i]}", output_dir, saved)
+    return saved
+
+
+def explain_margin(
+    data_path: str = "data/raw/synthetic_construction_projects.csv",
+    model_path: str = "models/margin_model.pkl",
+    sample_size: int = 500,
+    output_dir: Optional[str] = None,
+) -> List[str]:
+    """
+    SHAP summary + feature importance + локальные объяснения для модели маржи.
+    SHAP считается для всего набора (с кэшем), sample_size — проекты на графиках.
+    С output_dir графики не показываются, а сохраняются в файлы;
+    возвращается список путей.
+    """
+    with span("explain.margin.shap_values"):
+        X, shap_values = _shap_explanation(data_path, model_path, sample_size)
+    return _plot_shap(X, shap_values, "margin", output_dir)
+
+
+def explain_risk(
+    data_path: str = "data/raw/synthetic_construction_projects.csv",
+    model_path: str = "models/risk_model.pkl",
+    sample_size: int = 500,
+    output_dir: Optional[str] = None,
+) -> List[str]:
+    """
+    SHAP summary + feature importance + локальные объяснения для модели риска.
+    SHAP считается для всего набора (с кэшем), sample_size — проекты на графиках.
+    С output_dir графики не показываются, а сохраняются в файлы;
+    возвращается список путей.
+    """
+    model = load_model_for_path(model_path)
+    with span("explain.risk.shap_values"):
+        X, shap_values = _shap_explanation(data_path, model_path, sample_size)
+    saved = _plot_shap(X, shap_values, "risk", output_dir)
 
     # Feature importance из встроенных важностей модели (Plotly bar)
+    import plotly.express as px
+
     importance = pd.DataFrame(
         {"feature": FEATURE_COLUMNS, "importance": model.feature_importances_}
     ).sort_values(by="importance", ascending=False)
@@ -77,5 +206,10 @@ def explain_risk(
         orientation="h",
         title="Feature Importance — Risk of Budget Overrun",
     )
-    fig.show()
-
+    if output_dir is None:
+        fig.show()
+    else:
+        path = Path(output_dir) / "risk_feature_importance.html"
+        fig.write_html(path)
+        saved.append(str(path))
+    return saved
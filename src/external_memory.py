@@ -0,0 +1,113 @@
+import tempfile
+from typing import Any, Dict, Iterator, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import xgboost as xgb
+
+from .dataset import DEFAULT_CACHE_DIR, load_feature_matrix, load_table
+from .features import CATEGORICAL_COLUMNS, Vocabulary
+
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+# Каждая 5-я строка (по хэшу номера строки) уходит в тест, как test_size=0.2
+TEST_BUCKETS = 5
+
+
+def _test_mask(start: int, stop: int) -> np.ndarray:
+    """
+    Детерминированное разбиение train/test по номеру строки,
+    не зависящее от размера куска.
+    """
+    idx = np.arange(start, stop, dtype=np.uint64)
+    h = (idx * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+    return h % np.uint64(TEST_BUCKETS) == 0
+
+
+def _iter_split(
+    X: np.ndarray, y: pa.ChunkedArray, chunk_rows: int, subset: str
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    for start in range(0, len(X), chunk_rows):
+        stop = min(start + chunk_rows, len(X))
+        mask = _test_mask(start, stop)
+        if subset == "train":
+            mask = ~mask
+        y_chunk = y.slice(start, stop - start).to_numpy()
+        yield np.asarray(X[start:stop])[mask], y_chunk[mask]
+
+
+class _ChunkIter(xgb.DataIter):
+    """
+    Итератор кусков обучающей выборки для external-memory DMatrix.
+    """
+
+    def __init__(self, X: np.ndarray, y: pa.ChunkedArray, chunk_rows: int, cache_prefix: str) -> None:
+        self._X = X
+        self._y = y
+        self._chunk_rows = chunk_rows
+        self._chunks = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data) -> bool:
+        if self._chunks is None:
+            self._chunks = _iter_split(self._X, self._y, self._chunk_rows, "train")
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        input_data(data=chunk[0], label=chunk[1])
+        return True
+
+    def reset(self) -> None:
+        self._chunks = None
+
+
+def open_external(
+    data_path: str, cache_dir: str = DEFAULT_CACHE_DIR
+) -> Tuple[np.ndarray, pa.Table, Vocabulary]:
+    """
+    Memory-mapped матрица признаков, таблица источника и словарь категорий,
+    подобранный потоково (pyarrow unique по колонкам, без загрузки в pandas).
+    """
+    table = load_table(data_path, cache_dir=cache_dir)
+    vocabulary = {c: sorted(pc.unique(table.column(c)).to_pylist()) for c in CATEGORICAL_COLUMNS}
+    X = load_feature_matrix(data_path, vocabulary, cache_dir)
+    return X, table, vocabulary
+
+
+def train_booster(
+    X: np.ndarray,
+    y: pa.ChunkedArray,
+    params: Dict[str, Any],
+    objective: str,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    n_jobs: int = -1,
+) -> xgb.Booster:
+    """
+    Обучение бустера на external-memory DMatrix (tree_method="hist"):
+    данные подаются кусками по chunk_rows строк, квантильные страницы
+    кэшируются во временном каталоге.
+    """
+    params = dict(params)
+    num_boost_round = params.pop("n_estimators")
+    params.update(objective=objective, tree_method="hist", nthread=n_jobs)
+
+    with tempfile.TemporaryDirectory(prefix="xgb-extmem-") as tmp_dir:
+        it = _ChunkIter(X, y, chunk_rows, cache_prefix=f"{tmp_dir}/cache")
+        dtrain = xgb.ExtMemQuantileDMatrix(it, nthread=n_jobs)
+        booster = xgb.train(params, dtrain, num_boost_round=num_boost_round)
+        del dtrain
+    return booster
+
+
+def iter_test_predictions(
+    booster: xgb.Booster,
+    X: np.ndarray,
+    y: pa.ChunkedArray,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Пары (y_true, y_pred) по кускам тестовой выборки.
+    """
+    for X_chunk, y_chunk in _iter_split(X, y, chunk_rows, "test"):
+        yield y_chunk, booster.inplace_predict(X_chunk)
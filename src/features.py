@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+FEATURE_COLUMNS = [
+    "district_class",
+    "land_price_per_m2",
+    "soil_complexity",
+    "site_accessibility",
+    "land_area_m2",
+    "house_area_m2",
+    "design_complexity",
+    "materials_class",
+    "planned_duration_days",
+    "planned_budget",
+    "crew_experience_years",
+    "crew_efficiency_score",
+    "crew_current_load",
+    "supplier_reliability_score",
+    "delivery_distance_km",
+    "weather_season",
+    "material_price_index",
+    "mortgage_rate",
+    "market_demand_index",
+    "client_type",
+    "labor_cost_index",
+]
+
+CATEGORICAL_COLUMNS = ["district_class", "materials_class", "weather_season", "client_type"]
+
+VOCABULARY_FILENAME = "category_vocabulary.json"
+
+Vocabulary = Dict[str, List[str]]
+
+
+def vocabulary_path_for(model_path: str) -> str:
+    """
+    Словарь категорий хранится рядом с моделями.
+    """
+    return str(Path(model_path).with_name(VOCABULARY_FILENAME))
+
+
+def fit_category_vocabulary(df: pd.DataFrame) -> Vocabulary:
+    """
+    Словарь категорий по обучающим данным. Категории отсортированы,
+    поэтому коды совпадают с кодами LabelEncoder.
+    """
+    return {c: sorted(df[c].dropna().unique().tolist()) for c in CATEGORICAL_COLUMNS}
+
+
+def save_category_vocabulary(vocabulary: Vocabulary, path: str) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    # Уникальный временный файл: модели могут сохраняться параллельно
+    fd, tmp_path = tempfile.mkstemp(dir=Path(path).parent, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_category_vocabulary(path: str) -> Vocabulary:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def resolve_vocabulary(df: pd.DataFrame, path: Optional[str]) -> Vocabulary:
+    """
+    Сохранённый при обучении словарь, если он есть; иначе словарь
+    подбирается по df (модели, обученные до появления словаря).
+    """
+    if path and os.path.exists(path):
+        return load_category_vocabulary(path)
+    return fit_category_vocabulary(df)
+
+
+def encode_column(values, categories: List[str], column: str = "") -> np.ndarray:
+    """
+    Векторизованный перевод категорий в коды по словарю.
+    """
+    codes = pd.Index(categories).get_indexer(values)
+    if (codes < 0).any():
+        unknown = sorted({str(v) for v in np.asarray(values, dtype=object)[codes < 0]})
+        raise ValueError(f"Неизвестные значения признака {column}: {unknown}")
+    return codes
+
+
+def encode_features(
+    df: pd.DataFrame,
+    vocabulary: Vocabulary,
+    dtype=np.float32,
+) -> np.ndarray:
+    """
+    Матрица FEATURE_COLUMNS без копирования всего DataFrame:
+    категориальные признаки кодируются по словарю, числовые
+    переносятся поколоночно.
+    """
+    X = np.empty((len(df), len(FEATURE_COLUMNS)), dtype=dtype)
+    for j, c in enumerate(FEATURE_COLUMNS):
+        if c in vocabulary:
+            X[:, j] = encode_column(df[c].to_numpy(), vocabulary[c], c)
+        else:
+            X[:, j] = df[c].to_numpy()
+    return X
+
+
+def _encode_categories(df: pd.DataFrame, vocabulary: Optional[Vocabulary] = None) -> pd.DataFrame:
+    """
+    DataFrame с закодированными категориальными признаками
+    (остальные колонки остаются как есть).
+    """
+    vocabulary = vocabulary or fit_category_vocabulary(df)
+    return df.assign(
+        **{c: encode_column(df[c].to_numpy(), vocabulary[c], c) for c in CATEGORICAL_COLUMNS}
+    )
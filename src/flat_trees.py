@@ -0,0 +1,283 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from .registry import load_model_for_path
+
+if TYPE_CHECKING:
+    import xgboost as xgb
+
+
+# Пакет строк, на который разбивается вход при обходе деревьев:
+# ограничивает размер промежуточных массивов (строки × деревья)
+EVAL_CHUNK_ROWS = 16_384
+BENCHMARK_BATCH_SIZES = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+
+def _parse_base_score(value: str) -> float:
+    # XGBoost >= 3.0 хранит base_score как "[5.6666666E-1]"
+    return float(value.strip("[]").split(",")[0])
+
+
+class FlatForest:
+    """
+    Ансамбль деревьев XGBoost в виде плоских массивов NumPy
+    (все деревья подряд, индексы детей — глобальные):
+    feature, threshold, left, right, default_left, value.
+
+    Лист ссылается сам на себя (left = лист, threshold = +inf), поэтому
+    обход — это max_depth одинаковых векторных шагов по матрице
+    (строки × деревья) без Python-цикла по деревьям. Правило перехода
+    как в XGBoost: влево, если x < threshold; NaN — в сторону default_left.
+    XGBoost кладёт правого ребёнка сразу за левым (right = left + 1),
+    тогда шаг обходится без выборки из right.
+    """
+
+    ARRAYS = ("feature", "threshold", "left", "right", "default_left", "value", "roots")
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        default_left: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        base_margin: float,
+        objective: str,
+        max_depth: int,
+    ) -> None:
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.base_margin = np.float32(base_margin)
+        self.objective = objective
+        self.max_depth = max_depth
+        internal = left != np.arange(len(left))
+        self._consecutive = bool(np.all(right[internal] == left[internal] + 1))
+
+    @classmethod
+    def from_booster(cls, booster: "xgb.Booster") -> "FlatForest":
+        """
+        Экспорт обученного бустера (gbtree, без категориальных сплитов)
+        из его JSON-представления.
+        """
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        gradient_booster = learner["gradient_booster"]
+        if gradient_booster["name"] != "gbtree":
+            raise ValueError(f"Поддерживается только gbtree, а не {gradient_booster['name']}")
+        if int(learner["learner_model_param"].get("num_class", "0")) > 1:
+            raise ValueError("Многоклассовые модели не поддерживаются")
+
+        trees = gradient_booster["model"]["trees"]
+        best_iteration = learner.get("attributes", {}).get("best_iteration")
+        if best_iteration is not None:
+            # Как predict sklearn-обёртки: деревья до лучшей итерации
+            indptr = gradient_booster["model"]["iteration_indptr"]
+            trees = trees[: indptr[int(best_iteration) + 1]]
+
+        objective = learner["objective"]["name"]
+        base_score = _parse_base_score(learner["learner_model_param"]["base_score"])
+        if objective == "binary:logistic":
+            base_margin = np.log(base_score / (1 - base_score))
+        elif objective.startswith("reg:squared") or objective == "reg:absoluteerror":
+            base_margin = base_score
+        else:
+            raise ValueError(f"Неподдерживаемая цель: {objective}")
+
+        parts: Dict[str, list] = {name: [] for name in cls.ARRAYS}
+        offset = 0
+        max_depth = 0
+        for tree in trees:
+            if any(tree["split_type"]):
+                raise ValueError("Категориальные сплиты не поддерживаются")
+            left = np.asarray(tree["left_children"], dtype=np.int32)
+            right = np.asarray(tree["right_children"], dtype=np.int32)
+            n = len(left)
+            is_leaf = left == -1
+            own = np.arange(n, dtype=np.int32)
+
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            parts["feature"].append(np.where(is_leaf, 0, tree["split_indices"]).astype(np.int32))
+            parts["threshold"].append(np.where(is_leaf, np.float32(np.inf), conditions))
+            parts["left"].append(np.where(is_leaf, own, left) + offset)
+            parts["right"].append(np.where(is_leaf, own, right) + offset)
+            parts["default_left"].append(np.asarray(tree["default_left"], dtype=bool) | is_leaf)
+            # Для листа split_conditions хранит значение листа
+            parts["value"].append(np.where(is_leaf, conditions, np.float32(0)))
+            parts["roots"].append(np.array([offset], dtype=np.int32))
+
+            depth = np.zeros(n, dtype=np.int32)
+            parents = np.asarray(tree["parents"])
+            for node in range(1, n):
+                depth[node] = depth[parents[node]] + 1
+            max_depth = max(max_depth, int(depth.max()))
+            offset += n
+
+        arrays = {name: np.ascontiguousarray(np.concatenate(chunks)) for name, chunks in parts.items()}
+        return cls(**arrays, base_margin=base_margin, objective=objective, max_depth=max_depth)
+
+    @classmethod
+    def from_model(cls, model) -> "FlatForest":
+        """
+        Из sklearn-обёртки (XGBRegressor / XGBClassifier) или Booster.
+        """
+        booster = model.get_booster() if hasattr(model, "get_booster") else model
+        return cls.from_booster(booster)
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        n, n_features = X.shape
+        X_flat = np.ascontiguousarray(X).ravel()
+        row_offset = (np.arange(n, dtype=np.int64) * n_features)[:, None]
+        has_nan = bool(np.isnan(X_flat).any())
+
+        idx = np.broadcast_to(self.roots, (n, len(self.roots)))
+        for _ in range(self.max_depth):
+            x = X_flat.take(row_offset + self.feature.take(idx))
+            go_right = x >= self.threshold.take(idx)
+            if has_nan:
+                go_right = np.where(np.isnan(x), ~self.default_left.take(idx), go_right)
+            left = self.left.take(idx)
+            if self._consecutive:
+                idx = left + go_right
+            else:
+                idx = np.where(go_right, self.right.take(idx), left)
+        return self.value.take(idx)
+
+    def predict_margin(self, X: np.ndarray) -> np.ndarray:
+        """
+        Сырой выход бустера (до сигмоиды). Суммирование по деревьям —
+        последовательное во float32, в том же порядке, что у XGBoost.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), EVAL_CHUNK_ROWS):
+            block = X[start : start + EVAL_CHUNK_ROWS]
+            leaves = self._leaves(block)
+            acc = np.concatenate([np.full((len(block), 1), self.base_margin), leaves], axis=1)
+            out[start : start + len(block)] = np.cumsum(acc, axis=1, dtype=np.float32)[:, -1]
+        return out
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Прогноз в пространстве цели: значение регрессии или вероятность
+        положительного класса для binary:logistic.
+        """
+        margin = self.predict_margin(X)
+        if self.objective == "binary:logistic":
+            return (np.float32(1) / (np.float32(1) + np.exp(-margin))).astype(np.float32)
+        return margin
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            **{name: getattr(self, name) for name in self.ARRAYS},
+            base_margin=self.base_margin,
+            objective=np.asarray(self.objective),
+            max_depth=np.asarray(self.max_depth),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "FlatForest":
+        with np.load(path) as data:
+            return cls(
+                **{name: data[name] for name in cls.ARRAYS},
+                base_margin=float(data["base_margin"]),
+                objective=str(data["objective"]),
+                max_depth=int(data["max_depth"]),
+            )
+
+
+def flat_path_for(model_path: str) -> str:
+    """
+    Плоская версия модели хранится рядом с ней: margin_model.flat.npz.
+    """
+    return str(Path(model_path).with_suffix(".flat.npz"))
+
+
+def export_flat_model(model_path: str, output_path: Optional[str] = None) -> str:
+    """
+    Экспорт сохранённой модели (из реестра или pickle) в плоские массивы (.npz).
+    """
+    output_path = output_path or flat_path_for(model_path)
+    FlatForest.from_model(load_model_for_path(model_path)).save(output_path)
+    return output_path
+
+
+def _native_predict(model, X: np.ndarray) -> np.ndarray:
+    if hasattr(model, "predict_proba"):
+        return model.predict_proba(X)[:, 1]
+    return model.predict(X)
+
+
+def benchmark(
+    model_path: str = "models/margin_model.pkl",
+    batch_sizes: Sequence[int] = BENCHMARK_BATCH_SIZES,
+    repeat: int = 5,
+    seed: int = 42,
+) -> list:
+    """
+    Время FlatForest.predict и нативного predict XGBoost на пакетах
+    разного размера (лучшее из repeat запусков) + максимальное расхождение.
+    Строки — случайные проекты синтетического генератора.
+    """
+    from .data_generator import _generate_frame
+    from .features import encode_features, load_category_vocabulary, vocabulary_path_for
+
+    model = load_model_for_path(model_path)
+    forest = FlatForest.from_model(model)
+    vocabulary = load_category_vocabulary(vocabulary_path_for(model_path))
+    X_all = encode_features(_generate_frame(max(batch_sizes), np.random.default_rng(seed)), vocabulary)
+
+    rows = []
+    for n in batch_sizes:
+        X = X_all[:n]
+        runs = repeat if n <= 100_000 else 1
+        timings: Dict[str, Any] = {"batch_size": n}
+        for name, fn in (("flat", forest.predict), ("xgboost", lambda X: _native_predict(model, X))):
+            best = np.inf
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                out = fn(X)
+                best = min(best, time.perf_counter() - t0)
+            timings[f"{name}_ms"] = best * 1000
+            timings[f"{name}_out"] = out
+        timings["max_abs_diff"] = float(np.max(np.abs(timings.pop("flat_out") - timings.pop("xgboost_out"))))
+        timings["speedup"] = timings["xgboost_ms"] / timings["flat_ms"]
+        rows.append(timings)
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Плоские деревья XGBoost: экспорт и бенчмарк")
+    parser.add_argument("command", choices=["export", "benchmark"])
+    parser.add_argument("model_paths", nargs="*", default=["models/margin_model.pkl", "models/risk_model.pkl"])
+    parser.add_argument("--max-batch", type=int, default=BENCHMARK_BATCH_SIZES[-1])
+    args = parser.parse_args(argv)
+
+    for model_path in args.model_paths:
+        if args.command == "export":
+            print(f"{model_path} -> {export_flat_model(model_path)}")
+            continue
+        print(f"\n{model_path}")
+        print(f"{'batch':>9} {'flat, ms':>10} {'xgboost, ms':>12} {'speedup':>8} {'max |diff|':>11}")
+        sizes = [n for n in BENCHMARK_BATCH_SIZES if n <= args.max_batch]
+        for row in benchmark(model_path, sizes):
+            print(
+                f"{row['batch_size']:>9} {row['flat_ms']:>10.3f} {row['xgboost_ms']:>12.3f} "
+                f"{row['speedup']:>8.2f} {row['max_abs_diff']:>11.2e}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from typing import Any, Dict, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .data_generator import (
+    LABOR_COST_RANGE,
+    MARKET_DEMAND_RANGE,
+    MATERIAL_PRICE_RANGE,
+    MORTGAGE_RATE_RANGE,
+)
+from .features import FEATURE_COLUMNS
+from .simulator import ScenarioEngine, get_engine
+
+
+# Рыночная неопределённость по умолчанию — те же диапазоны, что в generate_data
+DEFAULT_DISTRIBUTIONS: Dict[str, Any] = {
+    "material_price_index": MATERIAL_PRICE_RANGE,
+    "mortgage_rate": MORTGAGE_RATE_RANGE,
+    "market_demand_index": MARKET_DEMAND_RANGE,
+    "labor_cost_index": LABOR_COST_RANGE,
+}
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def _sample(spec: Any, rng: np.random.Generator, n: int) -> np.ndarray:
+    """
+    Выборка по описанию распределения:
+    - (low, high) — равномерное,
+    - {"dist": "uniform", "low", "high"},
+    - {"dist": "normal", "mean", "std"[, "low", "high"]} — с обрезкой,
+    - {"dist": "triangular", "low", "mode", "high"},
+    - callable(rng, n) — произвольный генератор.
+    """
+    if callable(spec):
+        return np.asarray(spec(rng, n), dtype=np.float64)
+    if isinstance(spec, (tuple, list)):
+        return rng.uniform(spec[0], spec[1], n)
+
+    dist = spec.get("dist", "uniform")
+    if dist == "uniform":
+        return rng.uniform(spec["low"], spec["high"], n)
+    if dist == "normal":
+        values = rng.normal(spec["mean"], spec["std"], n)
+        return np.clip(values, spec.get("low", -np.inf), spec.get("high", np.inf))
+    if dist == "triangular":
+        return rng.triangular(spec["low"], spec["mode"], spec["high"], n)
+    raise ValueError(f"Неизвестное распределение: {dist}")
+
+
+def _summarize(
+    margin: np.ndarray,
+    risk: np.ndarray,
+    quantiles: Sequence[float],
+    tail_level: float,
+) -> Dict[str, float]:
+    """
+    Перцентили маржи и риска, VaR/CVaR маржи на уровне tail_level,
+    P(убыток) и P(перерасход) = среднее вероятностей модели по выборке.
+    """
+    result: Dict[str, float] = {
+        "margin_mean": float(margin.mean()),
+        "margin_std": float(margin.std()),
+    }
+    margin_q = np.quantile(margin, quantiles)
+    risk_q = np.quantile(risk, quantiles)
+    for q, m, r in zip(quantiles, margin_q, risk_q):
+        result[f"margin_p{round(q * 100):02d}"] = float(m)
+        result[f"risk_p{round(q * 100):02d}"] = float(r)
+
+    var = float(np.quantile(margin, tail_level))
+    result["margin_var"] = var
+    result["margin_cvar"] = float(margin[margin <= var].mean())
+    result["p_loss"] = float((margin < 0).mean())
+    result["p_overrun"] = float(risk.mean())
+    return result
+
+
+def simulate_market_uncertainty(
+    base_index: Union[int, Sequence[int]],
+    n_samples: int = 100_000,
+    distributions: Optional[Dict[str, Any]] = None,
+    overrides: Optional[Dict[str, Any]] = None,
+    seed: int = 42,
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+    tail_level: float = 0.05,
+    batch_size: int = 262_144,
+    engine: Optional[ScenarioEngine] = None,
+) -> Union[Dict[str, float], pd.DataFrame]:
+    """
+    Monte Carlo по рыночной неопределённости:
+    - для проекта base_index (с учётом overrides) рыночные признаки
+      заменяются n_samples выборками из distributions,
+    - выборки оцениваются векторизованно пакетами по batch_size строк,
+    - возвращаются перцентили маржи и риска, VaR/CVaR маржи,
+      P(убыток) и P(перерасход).
+
+    Для списка проектов используется одна и та же выборка рынка
+    (общие случайные числа), результат — DataFrame по проектам.
+    """
+    engine = engine or get_engine()
+    distributions = distributions or DEFAULT_DISTRIBUTIONS
+    for name in distributions:
+        if name not in FEATURE_COLUMNS:
+            raise KeyError(f"Неизвестный признак в distributions: {name}")
+
+    rng = np.random.default_rng(seed)
+    cols = [FEATURE_COLUMNS.index(name) for name in distributions]
+    samples = np.column_stack(
+        [_sample(spec, rng, n_samples) for spec in distributions.values()]
+    ).astype(np.float32)
+
+    indices = [base_index] if np.isscalar(base_index) else list(base_index)
+    base_rows = engine.build_matrix([(int(i), overrides) for i in indices])
+
+    rows = []
+    for base_row in base_rows:
+        margin = np.empty(n_samples)
+        risk = np.empty(n_samples)
+        for start in range(0, n_samples, batch_size):
+            stop = min(start + batch_size, n_samples)
+            X = np.repeat(base_row[None, :], stop - start, axis=0)
+            X[:, cols] = samples[start:stop]
+            margin[start:stop], risk[start:stop] = engine.predict(X)
+        rows.append(_summarize(margin, risk, quantiles, tail_level))
+
+    if np.isscalar(base_index):
+        return rows[0]
+    return pd.DataFrame(rows, index=pd.Index(indices, name="base_index"))
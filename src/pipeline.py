@@ -0,0 +1,417 @@
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .features import vocabulary_path_for
+from .profiling import span
+from .registry import tuning_path_for
+
+
+DEFAULT_STATE_DIR = "data/cache/pipeline"
+DATA_PATH = "data/raw/synthetic_construction_projects.csv"
+MARGIN_MODEL_PATH = "models/margin_model.pkl"
+RISK_MODEL_PATH = "models/risk_model.pkl"
+
+_SRC_DIR = Path(__file__).resolve().parent
+
+
+def _source_files(path: str) -> List[Path]:
+    p = Path(path)
+    if p.is_dir():
+        return sorted(f for f in p.rglob("*") if f.is_file())
+    return [p]
+
+
+def _signature(path: str) -> List[List[Any]]:
+    return [[str(f), f.stat().st_size, f.stat().st_mtime_ns] for f in _source_files(path)]
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    for f in _source_files(path):
+        h.update(f.name.encode())
+        with open(f, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+_RELATIVE_IMPORT = re.compile(r"^\s*from \.(\w+) import", re.MULTILINE)
+
+
+def _module_closure(modules: Sequence[str]) -> List[str]:
+    """
+    Модули src, от которых зависят modules: замыкание по относительным
+    импортам (включая импорты внутри функций — с запасом).
+    """
+    seen: set = set()
+    pending = list(modules)
+    while pending:
+        module = pending.pop()
+        if module in seen:
+            continue
+        seen.add(module)
+        source = (_SRC_DIR / f"{module}.py").read_text(encoding="utf-8")
+        pending.extend(m for m in _RELATIVE_IMPORT.findall(source) if (_SRC_DIR / f"{m}.py").exists())
+    return sorted(seen)
+
+
+def _code_version(modules: Sequence[str], packages: Sequence[str]) -> Dict[str, str]:
+    """
+    Версия кода этапа: sha256 исходников его модулей src/*.py и всех
+    модулей src, которые они импортируют, + версии библиотек, от которых
+    зависит результат.
+    """
+    version = {
+        m: hashlib.sha256((_SRC_DIR / f"{m}.py").read_bytes()).hexdigest()[:16]
+        for m in _module_closure(modules)
+    }
+    for package in packages:
+        version[package] = metadata.version(package)
+    return version
+
+
+def _to_json(value: Any) -> Any:
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+class Stage:
+    """
+    Этап конвейера.
+
+    fn(**params) выполняет этап и возвращает результат (метрики и т.п.,
+    сохраняется в JSON). outputs — файлы/каталоги, которые этап создаёт.
+    Ключ этапа — sha256 от params, версии кода (modules, packages)
+    и содержимого выходов этапов deps (для этапа без outputs — от его
+    ключа). Каждый выход принадлежит одному этапу.
+    cache=False — этап выполняется всегда (запуск приложения).
+    main_thread=True — этап выполняется в вызывающем потоке, а не в пуле
+    (интерактивный процесс: Ctrl+C приходит в главный поток).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        params: Optional[Dict[str, Any]] = None,
+        deps: Sequence[str] = (),
+        outputs: Sequence[str] = (),
+        modules: Sequence[str] = (),
+        packages: Sequence[str] = (),
+        cache: bool = True,
+        main_thread: bool = False,
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.params = params or {}
+        self.deps = list(deps)
+        self.outputs = list(outputs)
+        self.modules = list(modules)
+        self.packages = list(packages)
+        self.cache = cache
+        self.main_thread = main_thread
+
+
+class StageResult:
+    def __init__(self, name: str, status: str, key: Optional[str], result: Any, wall_s: float) -> None:
+        self.name = name
+        # "run" | "skipped" | "failed"
+        self.status = status
+        self.key = key
+        self.result = result
+        self.wall_s = wall_s
+
+
+class _Stamp:
+    """
+    Отметка последнего успешного выполнения этапа:
+    <state_dir>/<этап>.json — ключ, результат и sha256 каждого выхода
+    (с подписью размер/mtime, чтобы не хэшировать неизменённые файлы).
+    """
+
+    def __init__(self, stage: str, state_dir: str) -> None:
+        self.path = Path(state_dir) / f"{stage}.json"
+        self.data: Dict[str, Any] = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def output_digest(self, path: str) -> str:
+        """
+        sha256 выхода; пересчитывается, только если изменились размер/mtime.
+        """
+        recorded = self.data.get("outputs", {}).get(path)
+        signature = _signature(path)
+        if recorded and recorded["signature"] == signature:
+            return recorded["sha256"]
+        return _sha256(path)
+
+    def is_valid(self, key: str) -> bool:
+        outputs = self.data.get("outputs", {})
+        if self.data.get("key") != key:
+            return False
+        for path, recorded in outputs.items():
+            if not os.path.exists(path) or self.output_digest(path) != recorded["sha256"]:
+                return False
+        return True
+
+    def write(self, key: str, outputs: Sequence[str], result: Any, wall_s: float) -> None:
+        self.data = {
+            "key": key,
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "wall_s": wall_s,
+            "result": result,
+            "outputs": {p: {"signature": _signature(p), "sha256": _sha256(p)} for p in outputs},
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2, default=_to_json)
+        os.replace(tmp_path, self.path)
+
+
+def _stage_key(stage: Stage, upstream: Dict[str, Dict[str, str]]) -> str:
+    payload = {
+        "stage": stage.name,
+        "params": stage.params,
+        "code": _code_version(stage.modules, stage.packages),
+        "inputs": {dep: upstream[dep] for dep in stage.deps},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _digest(stamp: _Stamp, key: str) -> Dict[str, str]:
+    """
+    Что видят зависимые этапы: sha256 выходов или ключ этапа без выходов.
+    """
+    outputs = stamp.data.get("outputs")
+    if outputs:
+        return {p: v["sha256"] for p, v in outputs.items()}
+    return {"key": key}
+
+
+def _check_graph(stages: Sequence[Stage]) -> None:
+    names = [s.name for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Имена этапов должны быть уникальны")
+    owners: Dict[str, str] = {}
+    for stage in stages:
+        missing = [d for d in stage.deps if d not in names]
+        if missing:
+            raise ValueError(f"Этап {stage.name}: неизвестные зависимости {missing}")
+        for output in stage.outputs:
+            if output in owners:
+                raise ValueError(f"Выход {output} объявлен этапами {owners[output]} и {stage.name}")
+            owners[output] = stage.name
+
+    # Цикл — если этапы нельзя упорядочить
+    done: set = set()
+    pending = list(stages)
+    while pending:
+        ready = [s for s in pending if set(s.deps) <= done]
+        if not ready:
+            raise ValueError(f"Цикл в зависимостях: {[s.name for s in pending]}")
+        done.update(s.name for s in ready)
+        pending = [s for s in pending if s.name not in done]
+
+
+def run_pipeline(
+    stages: Sequence[Stage],
+    force: Sequence[str] = (),
+    state_dir: str = DEFAULT_STATE_DIR,
+    max_workers: int = 2,
+    on_stage_done: Optional[Callable[[StageResult], None]] = None,
+) -> Dict[str, StageResult]:
+    """
+    Выполнение DAG этапов:
+    - этап запускается, когда готовы все его deps; независимые этапы
+      идут параллельно (потоки, до max_workers одновременно),
+    - этап пропускается, если его ключ совпадает с последним успешным
+      запуском и выходы не изменились (результат берётся из отметки),
+    - force — имена этапов, которые нужно выполнить заново ("all" — все;
+      неизвестное имя — ValueError),
+    - on_stage_done(result) вызывается в вызывающем потоке по завершении
+      каждого этапа, до запуска зависящих от него.
+
+    При ошибке этапа зависимые от него этапы не запускаются,
+    уже запущенные дорабатывают; затем исключение пробрасывается.
+    """
+    _check_graph(stages)
+    by_name = {s.name: s for s in stages}
+    unknown = [name for name in force if name != "all" and name not in by_name]
+    if unknown:
+        raise ValueError(f"Неизвестные этапы: {unknown}")
+    digests: Dict[str, Dict[str, str]] = {}
+    results: Dict[str, StageResult] = {}
+
+    def execute(stage: Stage) -> StageResult:
+        t0 = time.perf_counter()
+        key = _stage_key(stage, digests)
+        stamp = _Stamp(stage.name, state_dir)
+        forced = "all" in force or stage.name in force
+        if stage.cache and not forced and stamp.is_valid(key):
+            digests[stage.name] = _digest(stamp, key)
+            print(f"⏭  {stage.name}: без изменений (ключ {key[:12]})")
+            return StageResult(stage.name, "skipped", key, stamp.data.get("result"), time.perf_counter() - t0)
+
+        print(f"▶  {stage.name}...")
+        with span(f"pipeline.{stage.name}", key=key[:12]):
+            result = stage.fn(**stage.params)
+        wall_s = time.perf_counter() - t0
+        if stage.cache:
+            stamp.write(key, stage.outputs, result, wall_s)
+        digests[stage.name] = _digest(stamp, key)
+        return StageResult(stage.name, "run", key, result, wall_s)
+
+    pending = list(stages)
+    running: Dict[Future, Stage] = {}
+    error: Optional[BaseException] = None
+
+    def record(stage: Stage, outcome: Callable[[], StageResult]) -> None:
+        nonlocal error
+        try:
+            results[stage.name] = outcome()
+        except Exception as e:
+            print(f"❌ {stage.name}: {e}")
+            results[stage.name] = StageResult(stage.name, "failed", None, None, 0.0)
+            error = error or e
+            return
+        if on_stage_done is not None:
+            on_stage_done(results[stage.name])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            if error is None:
+                ready = [s for s in pending if all(d in results for d in s.deps)]
+                for stage in ready:
+                    pending.remove(stage)
+                    if not stage.main_thread:
+                        running[pool.submit(execute, stage)] = stage
+                inline = [s for s in ready if s.main_thread]
+                for stage in inline:
+                    record(stage, lambda: execute(stage))
+                if inline:
+                    continue
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record(running.pop(future), future.result)
+    if error is not None:
+        raise error
+    return {name: results[name] for name in by_name if name in results}
+
+
+# --- Этапы main.py ------------------------------------------------------
+
+def _generate(output_path: str, n_projects: int, seed: int) -> Dict[str, Any]:
+    from .data_generator import generate_data
+
+    generate_data(output_path, n_projects=n_projects, seed=seed)
+    return {"n_projects": n_projects}
+
+
+def _cache_dataset(data_path: str) -> Dict[str, Any]:
+    from .dataset import load_dataset, load_feature_matrix
+    from .features import CATEGORICAL_COLUMNS, fit_category_vocabulary
+
+    vocabulary = fit_category_vocabulary(load_dataset(data_path, columns=CATEGORICAL_COLUMNS))
+    X = load_feature_matrix(data_path, vocabulary)
+    return {"rows": int(X.shape[0]), "matrix": X.filename}
+
+
+def _train(
+    data_path: str,
+    margin_model_path: str,
+    risk_model_path: str,
+    n_jobs: int,
+    use_tuned: bool,
+    tuning: Dict[str, Optional[str]],
+) -> Dict[str, Any]:
+    from .train_pipeline import train_models
+
+    return train_models(data_path, margin_model_path, risk_model_path, n_jobs=n_jobs, use_tuned=use_tuned)
+
+
+def _file_hash(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def default_stages(
+    data_path: str = DATA_PATH,
+    margin_model_path: str = MARGIN_MODEL_PATH,
+    risk_model_path: str = RISK_MODEL_PATH,
+    n_projects: int = 6000,
+    seed: int = 42,
+    launch_app: Optional[Callable[[], Any]] = None,
+    use_tuned: bool = False,
+) -> List[Stage]:
+    """
+    generate -> cache_dataset -> train -> app.
+
+    train — train_models: данные загружаются один раз, одно стратифицированное
+    разбиение, регрессор и классификатор обучаются параллельно (по половине
+    ядер; n_jobs входит в ключ: число потоков hist-алгоритма может немного
+    менять результат). Гиперпараметры и диапазоны рынка — константы
+    модулей, поэтому входят в ключ через версию кода; use_tuned=True —
+    параметры последнего подбора из реестра (хэш tuning.json входит в ключ).
+    app (если задан launch_app) не кэшируется, выполняется всегда после
+    обучения и в главном потоке.
+    """
+    n_jobs = max(1, (os.cpu_count() or 2) // 2)
+    stages = [
+        Stage(
+            "generate",
+            _generate,
+            {"output_path": data_path, "n_projects": n_projects, "seed": seed},
+            outputs=[data_path],
+            modules=["data_generator"],
+            packages=["numpy", "pandas"],
+        ),
+        Stage(
+            "cache_dataset",
+            _cache_dataset,
+            {"data_path": data_path},
+            deps=["generate"],
+            modules=["dataset", "features"],
+            packages=["pyarrow"],
+        ),
+        Stage(
+            "train",
+            _train,
+            {
+                "data_path": data_path,
+                "margin_model_path": margin_model_path,
+                "risk_model_path": risk_model_path,
+                "n_jobs": n_jobs,
+                "use_tuned": use_tuned,
+                # Новый подбор гиперпараметров меняет ключ обучения
+                "tuning": {
+                    p: _file_hash(tuning_path_for(p)) if use_tuned else None
+                    for p in (margin_model_path, risk_model_path)
+                },
+            },
+            deps=["cache_dataset"],
+            outputs=sorted(
+                {margin_model_path, risk_model_path, vocabulary_path_for(margin_model_path),
+                 vocabulary_path_for(risk_model_path)}
+            ),
+            modules=["train_pipeline"],
+            packages=["xgboost", "scikit-learn"],
+        ),
+    ]
+    if launch_app is not None:
+        stages.append(Stage("app", launch_app, deps=["train"], cache=False, main_thread=True))
+    return stages
@@ -0,0 +1,196 @@
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .features import FEATURE_COLUMNS
+from .simulator import ScenarioEngine, get_engine
+
+
+CREW_COLUMNS = ["crew_experience_years", "crew_efficiency_score", "crew_current_load"]
+SUPPLIER_COLUMNS = ["supplier_reliability_score", "delivery_distance_km"]
+
+
+def score_tensor(
+    projects: Sequence[int],
+    crews: pd.DataFrame,
+    suppliers: pd.DataFrame,
+    engine: Optional[ScenarioEngine] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Тензоры прогноза маржи и риска размера (проекты × бригады × поставщики).
+    Все комбинации собираются в одну матрицу и оцениваются одним predict
+    на модель. Параметры бригад/поставщиков заменяют соответствующие
+    признаки проекта (колонки, отсутствующие в crews/suppliers, не меняются).
+    """
+    engine = engine or get_engine()
+    base = engine.build_matrix([(int(p), None) for p in projects])
+    P, C, S = len(base), len(crews), len(suppliers)
+
+    X = np.broadcast_to(base[:, None, None, :], (P, C, S, base.shape[1])).copy()
+    for col in CREW_COLUMNS:
+        if col in crews.columns:
+            j = FEATURE_COLUMNS.index(col)
+            X[:, :, :, j] = crews[col].to_numpy(dtype=np.float32)[None, :, None]
+    for col in SUPPLIER_COLUMNS:
+        if col in suppliers.columns:
+            j = FEATURE_COLUMNS.index(col)
+            X[:, :, :, j] = suppliers[col].to_numpy(dtype=np.float32)[None, None, :]
+
+    margin, risk = engine.predict(X.reshape(-1, X.shape[-1]))
+    budget = base[:, FEATURE_COLUMNS.index("planned_budget")].astype(np.float64)
+    return {
+        "margin": margin.reshape(P, C, S),
+        "risk": risk.reshape(P, C, S),
+        "planned_budget": budget,
+    }
+
+
+def _greedy(value: np.ndarray, crew_cap: np.ndarray, supplier_cap: np.ndarray) -> np.ndarray:
+    """
+    Жадное назначение: лучшие допустимые тройки (проект, бригада, поставщик)
+    по убыванию ценности с учётом вместимости. -1 — проект не назначен.
+    """
+    P, C, S = value.shape
+    assignment = np.full((P, 2), -1)
+    crew_left = crew_cap.copy()
+    supplier_left = supplier_cap.copy()
+    order = np.argsort(-value, axis=None)
+    for flat in order:
+        if not np.isfinite(value.flat[flat]):
+            break
+        p, c, s = np.unravel_index(flat, value.shape)
+        if assignment[p, 0] >= 0 or crew_left[c] == 0 or supplier_left[s] == 0:
+            continue
+        assignment[p] = (c, s)
+        crew_left[c] -= 1
+        supplier_left[s] -= 1
+    return assignment
+
+
+def _local_search(
+    value: np.ndarray,
+    assignment: np.ndarray,
+    crew_cap: np.ndarray,
+    supplier_cap: np.ndarray,
+    max_iter: int,
+) -> np.ndarray:
+    """
+    Улучшение назначения: перевод проекта на свободную пару
+    (бригада, поставщик) и обмен бригадами/поставщиками между проектами.
+    Принимается любой улучшающий ход, пока они есть (или до max_iter).
+    """
+    P, C, S = value.shape
+    assignment = assignment.copy()
+
+    def used(k: int, size: int) -> np.ndarray:
+        mask = assignment[:, k] >= 0
+        return np.bincount(assignment[mask, k], minlength=size)
+
+    for _ in range(max_iter):
+        improved = False
+        crew_free = crew_cap - used(0, C)
+        supplier_free = supplier_cap - used(1, S)
+
+        # 1. Перевод проекта на другую пару с учётом освобождаемых мест
+        for p in range(P):
+            c0, s0 = assignment[p]
+            current = value[p, c0, s0] if c0 >= 0 else -np.inf
+            crew_ok = crew_free > 0
+            supplier_ok = supplier_free > 0
+            if c0 >= 0:
+                crew_ok[c0] = True
+                supplier_ok[s0] = True
+            candidates = np.where(crew_ok[:, None] & supplier_ok[None, :], value[p], -np.inf)
+            c, s = np.unravel_index(np.argmax(candidates), candidates.shape)
+            if candidates[c, s] > current + 1e-12:
+                if c0 >= 0:
+                    crew_free[c0] += 1
+                    supplier_free[s0] += 1
+                crew_free[c] -= 1
+                supplier_free[s] -= 1
+                assignment[p] = (c, s)
+                improved = True
+
+        # 2. Обмен бригадами / поставщиками между парами проектов
+        for p in range(P):
+            for q in range(p + 1, P):
+                (cp, sp), (cq, sq) = assignment[p], assignment[q]
+                if cp < 0 or cq < 0:
+                    continue
+                now = value[p, cp, sp] + value[q, cq, sq]
+                swap_crew = value[p, cq, sp] + value[q, cp, sq]
+                swap_supplier = value[p, cp, sq] + value[q, cq, sp]
+                if swap_crew > now + 1e-12 and swap_crew >= swap_supplier:
+                    assignment[p, 0], assignment[q, 0] = cq, cp
+                    improved = True
+                elif swap_supplier > now + 1e-12:
+                    assignment[p, 1], assignment[q, 1] = sq, sp
+                    improved = True
+
+        if not improved:
+            break
+    return assignment
+
+
+def optimize_portfolio(
+    projects: Sequence[int],
+    crews: pd.DataFrame,
+    suppliers: pd.DataFrame,
+    max_risk: float = 1.0,
+    objective: str = "margin",
+    max_iter: int = 100,
+    engine: Optional[ScenarioEngine] = None,
+) -> Dict[str, Any]:
+    """
+    Распределение бригад и поставщиков по годовой программе проектов:
+    - один раз считается тензор прогнозов (проекты × бригады × поставщики),
+    - варианты с риском перерасхода выше max_risk недопустимы,
+    - жадное решение улучшается локальным поиском.
+
+    objective: "margin" — сумма прогнозной маржи, "profit" — сумма
+    маржи × плановый бюджет. Вместимость задаётся колонкой capacity
+    (по умолчанию бригада берёт 1 проект, поставщик — любое число).
+
+    Возвращает таблицу назначений, итоговую ценность и средний риск;
+    проекты без допустимого варианта остаются с crew/supplier = None.
+    """
+    if objective not in ("margin", "profit"):
+        raise ValueError(f"Неизвестная цель оптимизации: {objective}")
+
+    scores = score_tensor(projects, crews, suppliers, engine)
+    value = scores["margin"].copy()
+    if objective == "profit":
+        value *= scores["planned_budget"][:, None, None]
+    value[scores["risk"] > max_risk] = -np.inf
+
+    crew_cap = crews["capacity"].to_numpy(dtype=int) if "capacity" in crews else np.ones(len(crews), dtype=int)
+    supplier_cap = (
+        suppliers["capacity"].to_numpy(dtype=int)
+        if "capacity" in suppliers
+        else np.full(len(suppliers), len(projects), dtype=int)
+    )
+
+    assignment = _greedy(value, crew_cap, supplier_cap)
+    assignment = _local_search(value, assignment, crew_cap, supplier_cap, max_iter)
+
+    rows = []
+    for p, (c, s) in enumerate(assignment):
+        assigned = c >= 0
+        rows.append(
+            {
+                "project": projects[p],
+                "crew": crews.index[c] if assigned else None,
+                "supplier": suppliers.index[s] if assigned else None,
+                "margin_pred": scores["margin"][p, c, s] if assigned else np.nan,
+                "risk_prob": scores["risk"][p, c, s] if assigned else np.nan,
+                "value": value[p, c, s] if assigned else np.nan,
+            }
+        )
+    table = pd.DataFrame(rows)
+    return {
+        "assignment": table,
+        "total_value": float(table["value"].sum()),
+        "mean_risk": float(table["risk_prob"].mean()),
+        "unassigned": table.loc[table["crew"].isna(), "project"].tolist(),
+    }
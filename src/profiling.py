@@ -0,0 +1,283 @@
+import cProfile
+import fnmatch
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+try:
+    import resource  # только Unix
+except ImportError:
+    resource = None
+
+
+# Период опроса RSS для пиковой памяти этапов (секунды)
+SAMPLE_INTERVAL_S = 0.01
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss_mb() -> float:
+    """
+    Текущая RSS процесса: Linux — /proc/self/statm, иначе psutil (если
+    установлен), иначе пиковая RSS из resource (Unix); без них — NaN.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except OSError:
+        pass
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return float("nan")
+
+
+class Span:
+    """
+    Замер одного этапа: wall/CPU время, RSS на входе и пиковая RSS
+    за время этапа, число строк (задаётся кодом этапа: span.rows = n).
+    """
+
+    __slots__ = (
+        "name", "parent", "depth", "thread", "rows", "attrs",
+        "start", "wall_s", "cpu_s", "rss_start_mb", "peak_rss_mb",
+    )
+
+    def __init__(self, name: str, rows: Optional[int] = None, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.parent: Optional[str] = None
+        self.depth = 0
+        self.thread = threading.get_ident()
+        self.rows = rows
+        self.attrs = attrs or {}
+        self.start = 0.0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.rss_start_mb = 0.0
+        self.peak_rss_mb = 0.0
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "thread": self.thread,
+            "start_s": self.start - origin,
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "rss_start_mb": self.rss_start_mb,
+            "peak_rss_mb": self.peak_rss_mb,
+            "rows": self.rows,
+            "rows_per_s": self.rows / self.wall_s if self.rows and self.wall_s > 0 else None,
+            **({"attrs": self.attrs} if self.attrs else {}),
+        }
+
+
+class Recorder:
+    """
+    Сборщик завершённых этапов одного прогона. Пока открыт хотя бы один
+    этап, фоновый поток раз в SAMPLE_INTERVAL_S обновляет пиковую RSS
+    всех открытых этапов.
+
+    profile_stages — шаблоны имён этапов (fnmatch), которые выполняются
+    под cProfile; статистика пишется в profile_dir/<этап>-<n>.prof.
+    cProfile видит только поток, в котором открыт этап.
+    """
+
+    def __init__(
+        self,
+        profile_stages: Sequence[str] = (),
+        profile_dir: str = "reports/profiles",
+        sample_interval: float = SAMPLE_INTERVAL_S,
+    ) -> None:
+        self.profile_stages = list(profile_stages)
+        self.profile_dir = profile_dir
+        self.sample_interval = sample_interval
+        self.origin = time.perf_counter()
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        self.spans: List[Span] = []
+        self.profiles: List[str] = []
+        self._open: set = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._sampler = threading.Thread(target=self._sample, name="profiling-rss", daemon=True)
+        self._sampler.start()
+
+    def _sample(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait()
+            rss = _rss_mb()
+            with self._lock:
+                for s in self._open:
+                    s.peak_rss_mb = max(s.peak_rss_mb, rss)
+                if not self._open:
+                    self._wakeup.clear()
+            time.sleep(self.sample_interval)
+
+    def open(self, s: Span) -> None:
+        with self._lock:
+            self._open.add(s)
+        self._wakeup.set()
+
+    def close(self, s: Span) -> None:
+        with self._lock:
+            self._open.discard(s)
+            self.spans.append(s)
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+        self._sampler.join()
+
+    def should_profile(self, name: str) -> bool:
+        return any(fnmatch.fnmatchcase(name, p) for p in self.profile_stages)
+
+    def dump_profile(self, name: str, profiler: cProfile.Profile) -> None:
+        Path(self.profile_dir).mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            path = str(Path(self.profile_dir) / f"{name}-{len(self.profiles)}.prof")
+            self.profiles.append(path)
+        profiler.dump_stats(path)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Отчёт прогона: spans — плоский список этапов, traceEvents — те же
+        этапы в формате Chrome Trace (chrome://tracing, Perfetto).
+        """
+        spans = sorted(self.spans, key=lambda s: s.start)
+        pid = os.getpid()
+        return {
+            "started_at": self.started_at,
+            "spans": [s.to_dict(self.origin) for s in spans],
+            "profiles": self.profiles,
+            "traceEvents": [
+                {
+                    "name": s.name,
+                    "ph": "X",
+                    "ts": (s.start - self.origin) * 1e6,
+                    "dur": s.wall_s * 1e6,
+                    "pid": pid,
+                    "tid": s.thread,
+                    "args": {
+                        "cpu_s": s.cpu_s,
+                        "peak_rss_mb": s.peak_rss_mb,
+                        "rows": s.rows,
+                        **s.attrs,
+                    },
+                }
+                for s in spans
+            ],
+        }
+
+    def write(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=1, default=str)
+        os.replace(tmp_path, path)
+
+    def summary(self) -> str:
+        """
+        Таблица этапов для консоли (вложенные этапы — с отступом).
+        """
+        lines = [f"{'stage':<36} {'wall, s':>9} {'cpu, s':>9} {'peak RSS, MB':>13} {'rows':>12}"]
+        for s in sorted(self.spans, key=lambda s: s.start):
+            rows = f"{s.rows:,}" if s.rows else ""
+            lines.append(
+                f"{'  ' * s.depth + s.name:<36} {s.wall_s:>9.3f} {s.cpu_s:>9.3f} "
+                f"{s.peak_rss_mb:>13.0f} {rows:>12}"
+            )
+        return "\n".join(lines)
+
+
+_RECORDER: Optional[Recorder] = None
+_local = threading.local()
+
+
+def current_recorder() -> Optional[Recorder]:
+    return _RECORDER
+
+
+@contextmanager
+def span(name: str, rows: Optional[int] = None, **attrs: Any) -> Iterator[Span]:
+    """
+    Замер этапа:
+
+        with span("train.fit", rows=len(X_train)) as s:
+            model.fit(X_train, y_train)
+
+    Без активного profile_run замеряется только wall-время (s.wall_s)
+    и ничего не записывается. CPU — время процесса (включая потоки
+    XGBoost и параллельные этапы).
+    """
+    s = Span(name, rows, attrs)
+    recorder = _RECORDER
+    if recorder is None:
+        s.start = time.perf_counter()
+        try:
+            yield s
+        finally:
+            s.wall_s = time.perf_counter() - s.start
+        return
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    s.parent = stack[-1] if stack else None
+    s.depth = len(stack)
+    stack.append(name)
+
+    s.rss_start_mb = s.peak_rss_mb = _rss_mb()
+    recorder.open(s)
+    profiler = cProfile.Profile() if recorder.should_profile(name) else None
+    cpu0 = time.process_time()
+    s.start = time.perf_counter()
+    if profiler is not None:
+        try:
+            profiler.enable()
+        except ValueError:
+            # Уже идёт профилирование объемлющего этапа
+            profiler = None
+    try:
+        yield s
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        s.wall_s = time.perf_counter() - s.start
+        s.cpu_s = time.process_time() - cpu0
+        s.peak_rss_mb = max(s.peak_rss_mb, _rss_mb())
+        stack.pop()
+        recorder.close(s)
+        if profiler is not None:
+            recorder.dump_profile(name, profiler)
+
+
+@contextmanager
+def profile_run(
+    output_path: Optional[str] = None,
+    profile_stages: Sequence[str] = (),
+    profile_dir: str = "reports/profiles",
+) -> Iterator[Recorder]:
+    """
+    Включает запись этапов (span) во всём процессе на время блока;
+    по выходу отчёт пишется в output_path (JSON + Chrome Trace).
+    """
+    global _RECORDER
+    recorder = Recorder(profile_stages, profile_dir)
+    previous, _RECORDER = _RECORDER, recorder
+    try:
+        yield recorder
+    finally:
+        _RECORDER = previous
+        recorder.stop()
+        if output_path:
+            recorder.write(output_path)
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .features import FEATURE_COLUMNS
+
+
+DEFAULT_REGISTRY_DIR = "models/registry"
+MODEL_FILENAME = "model.ubj"
+META_FILENAME = "meta.json"
+LATEST_FILENAME = "LATEST"
+TUNING_FILENAME = "tuning.json"
+# Сколько версий модели хранится в реестре (старые удаляются при регистрации)
+DEFAULT_KEEP_VERSIONS = 5
+
+# Классы sklearn-обёрток XGBoost, которые можно восстановить из реестра
+_MODEL_CLASSES = ("XGBRegressor", "XGBClassifier")
+
+
+def registry_dir_for(model_path: str) -> str:
+    """
+    Реестр лежит рядом с моделями: models/registry.
+    """
+    return str(Path(model_path).parent / "registry")
+
+
+def model_name_for(model_path: str) -> str:
+    """
+    Имя модели в реестре — имя файла без расширения (margin_model, risk_model).
+    """
+    return Path(model_path).stem
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def register_model(
+    name: str,
+    model,
+    metrics: Optional[Dict[str, Any]] = None,
+    vocabulary: Optional[Dict[str, List[str]]] = None,
+    data_hash: Optional[str] = None,
+    registry_dir: str = DEFAULT_REGISTRY_DIR,
+    keep: int = DEFAULT_KEEP_VERSIONS,
+) -> str:
+    """
+    Новая версия модели в реестре:
+    - версия — первые 16 символов sha256 бустера в нативном формате XGBoost (UBJSON),
+    - рядом meta.json: хэш данных, метрики, признаки, словарь категорий,
+      параметры модели,
+    - каталог версии сначала пишется во временный и переименовывается целиком,
+      затем атомарно обновляется указатель LATEST,
+    - хранятся только keep последних версий (см. prune_versions).
+
+    Повторная регистрация той же модели не создаёт новую версию.
+    Возвращает идентификатор версии.
+    """
+    raw = bytes(model.get_booster().save_raw("ubj"))
+    sha256 = hashlib.sha256(raw).hexdigest()
+    version = sha256[:16]
+
+    model_dir = Path(registry_dir) / name
+    version_dir = model_dir / version
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    if not version_dir.exists():
+        meta = {
+            "name": name,
+            "version": version,
+            "sha256": sha256,
+            "model_class": type(model).__name__,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "data_hash": data_hash,
+            "metrics": metrics or {},
+            "feature_columns": list(FEATURE_COLUMNS),
+            "vocabulary": vocabulary,
+            "params": model.get_params(),
+        }
+        tmp_dir = Path(tempfile.mkdtemp(dir=model_dir, prefix=f".{version}."))
+        (tmp_dir / MODEL_FILENAME).write_bytes(raw)
+        (tmp_dir / META_FILENAME).write_text(
+            json.dumps(meta, ensure_ascii=False, indent=2, default=_to_json), encoding="utf-8"
+        )
+        try:
+            os.replace(tmp_dir, version_dir)
+        except OSError:
+            # Ту же версию успел записать другой процесс
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    _write_atomic(model_dir / LATEST_FILENAME, version.encode())
+    prune_versions(name, keep, registry_dir)
+    return version
+
+
+def prune_versions(name: str, keep: int = DEFAULT_KEEP_VERSIONS, registry_dir: str = DEFAULT_REGISTRY_DIR) -> List[str]:
+    """
+    Удаляет версии модели старше keep последних (текущая LATEST
+    сохраняется всегда). Возвращает удалённые версии.
+    """
+    current = latest_version(name, registry_dir)
+    old = [m["version"] for m in list_versions(name, registry_dir)[:-keep or None]]
+    removed = [v for v in old if v != current]
+    for version in removed:
+        shutil.rmtree(Path(registry_dir) / name / version, ignore_errors=True)
+    return removed
+
+
+def latest_version(name: str, registry_dir: str = DEFAULT_REGISTRY_DIR) -> Optional[str]:
+    path = Path(registry_dir) / name / LATEST_FILENAME
+    if not path.exists():
+        return None
+    return path.read_text().strip()
+
+
+def resolve_version(name: str, version: str = "latest", registry_dir: str = DEFAULT_REGISTRY_DIR) -> str:
+    """
+    "latest" или (префикс) хэша версии -> полный идентификатор версии.
+    """
+    if version == "latest":
+        resolved = latest_version(name, registry_dir)
+        if resolved is None:
+            raise KeyError(f"В реестре нет модели {name}")
+        return resolved
+
+    model_dir = Path(registry_dir) / name
+    matches = [
+        p.name for p in model_dir.glob(f"{version}*") if p.is_dir() and not p.name.startswith(".")
+    ] if model_dir.exists() else []
+    if len(matches) != 1:
+        raise KeyError(f"Версия {version} модели {name} не найдена или неоднозначна")
+    return matches[0]
+
+
+def load_metadata(name: str, version: str = "latest", registry_dir: str = DEFAULT_REGISTRY_DIR) -> Dict[str, Any]:
+    version = resolve_version(name, version, registry_dir)
+    path = Path(registry_dir) / name / version / META_FILENAME
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def list_versions(name: str, registry_dir: str = DEFAULT_REGISTRY_DIR) -> List[Dict[str, Any]]:
+    """
+    Метаданные всех версий модели (от старых к новым).
+    """
+    model_dir = Path(registry_dir) / name
+    if not model_dir.exists():
+        return []
+    metas = [
+        json.loads((p / META_FILENAME).read_text(encoding="utf-8"))
+        for p in model_dir.iterdir()
+        if p.is_dir() and not p.name.startswith(".")
+    ]
+    return sorted(metas, key=lambda m: m["created_at"])
+
+
+def load_model(name: str, version: str = "latest", registry_dir: str = DEFAULT_REGISTRY_DIR):
+    """
+    sklearn-обёртка XGBoost из нативного файла бустера. Читается только
+    запрошенная версия (meta.json + model.ubj).
+    """
+    import xgboost
+
+    meta = load_metadata(name, version, registry_dir)
+    if meta["model_class"] not in _MODEL_CLASSES:
+        raise ValueError(f"Неизвестный класс модели: {meta['model_class']}")
+    model = getattr(xgboost, meta["model_class"])()
+    model.load_model(str(Path(registry_dir) / name / meta["version"] / MODEL_FILENAME))
+    return model
+
+
+def save_tuning(name: str, tuning: Dict[str, Any], registry_dir: str = DEFAULT_REGISTRY_DIR) -> str:
+    """
+    Результат подбора гиперпараметров модели (лучшая конфигурация +
+    leaderboard) — <registry_dir>/<name>/tuning.json, заменяется атомарно.
+    """
+    model_dir = Path(registry_dir) / name
+    model_dir.mkdir(parents=True, exist_ok=True)
+    path = model_dir / TUNING_FILENAME
+    _write_atomic(path, json.dumps(tuning, ensure_ascii=False, indent=2, default=_to_json).encode())
+    return str(path)
+
+
+def load_tuning(name: str, registry_dir: str = DEFAULT_REGISTRY_DIR) -> Optional[Dict[str, Any]]:
+    path = Path(registry_dir) / name / TUNING_FILENAME
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def tuning_path_for(model_path: str) -> str:
+    return str(Path(registry_dir_for(model_path)) / model_name_for(model_path) / TUNING_FILENAME)
+
+
+def tuned_params(model_path: str, defaults: Dict[str, Any], data_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Гиперпараметры для обучения модели: defaults, поверх которых —
+    лучшая конфигурация из реестра (если подбор уже запускался).
+
+    С data_path подбор применяется, только если он выполнен на тех же
+    данных (data_hash в tuning.json): число деревьев подобрано ранней
+    остановкой на конкретном наборе. Иначе — defaults с предупреждением.
+    """
+    name = model_name_for(model_path)
+    tuning = load_tuning(name, registry_dir_for(model_path))
+    if tuning is None:
+        return dict(defaults)
+    if data_path is not None:
+        from .dataset import dataset_hash
+
+        if tuning.get("data_hash") != dataset_hash(data_path):
+            print(f"⚠️ Подбор {name} выполнен на других данных — используются параметры по умолчанию")
+            return dict(defaults)
+    return {**defaults, **tuning["best_params"]}
+
+
+def model_source(model_path: str) -> str:
+    """
+    Файл, который определяет текущую модель для привычного пути
+    (models/margin_model.pkl): указатель LATEST её реестра (содержимое —
+    хэш версии). Для модели вне реестра (старый pickle, нативный файл
+    .ubj / .json) — сам model_path.
+
+    За этим файлом следит ScenarioEngine, его хэш входит в ключ кэша SHAP.
+    """
+    if Path(model_path).suffix not in (".ubj", ".json"):
+        latest = Path(registry_dir_for(model_path)) / model_name_for(model_path) / LATEST_FILENAME
+        if latest.exists():
+            return str(latest)
+    return model_path
+
+
+def load_model_for_path(model_path: str):
+    """
+    Текущая модель для model_path (см. model_source): последняя версия
+    из реестра через load_model — читается только нативный бустер этой
+    версии. Pickle по привычному пути — лишь экспорт для совместимости
+    и загружается только для моделей вне реестра.
+    """
+    if model_source(model_path) != model_path:
+        return load_model(model_name_for(model_path), "latest", registry_dir_for(model_path))
+
+    if Path(model_path).suffix in (".ubj", ".json"):
+        import xgboost
+
+        # Класс sklearn-обёртки берётся из meta.json версии рядом с файлом
+        meta_path = Path(model_path).with_name(META_FILENAME)
+        if not meta_path.exists():
+            raise ValueError(f"Нет {META_FILENAME} рядом с {model_path}: класс модели неизвестен")
+        model_class = json.loads(meta_path.read_text(encoding="utf-8"))["model_class"]
+        if model_class not in _MODEL_CLASSES:
+            raise ValueError(f"Неизвестный класс модели: {model_class}")
+        model = getattr(xgboost, model_class)()
+        model.load_model(model_path)
+        return model
+
+    import joblib
+
+    return joblib.load(model_path)
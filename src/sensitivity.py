@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .features import FEATURE_COLUMNS
+from .simulator import ScenarioEngine, get_engine
+
+
+DEFAULT_SWEEP_CACHE_DIR = "data/cache/sweeps"
+# Ограничение размера одной матрицы (строк) при оценке выборки проектов
+MAX_BATCH_ROWS = 1_000_000
+
+
+def _cache_key(fingerprint: str, grids: Dict[str, List[Any]], projects: List[int]) -> str:
+    payload = json.dumps(
+        {"models": fingerprint, "grids": grids, "projects": projects}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _select_projects(
+    engine: ScenarioEngine,
+    base_index: Union[int, Sequence[int], None],
+    sample_size: Optional[int],
+    seed: int,
+) -> List[int]:
+    if sample_size:
+        rng = np.random.default_rng(seed)
+        n = engine.n_projects
+        return sorted(rng.choice(n, size=min(sample_size, n), replace=False).tolist())
+    if base_index is None:
+        return [0]
+    if np.isscalar(base_index):
+        return [int(base_index)]
+    return [int(i) for i in base_index]
+
+
+def sensitivity_sweep(
+    grids: Dict[str, Sequence[Any]],
+    base_index: Union[int, Sequence[int], None] = 0,
+    sample_size: Optional[int] = None,
+    seed: int = 42,
+    engine: Optional[ScenarioEngine] = None,
+    cache_dir: Optional[str] = DEFAULT_SWEEP_CACHE_DIR,
+) -> Dict[str, Any]:
+    """
+    1D/2D анализ чувствительности (partial dependence):
+    - grids — один или два признака и их значения,
+    - базовые проекты: base_index (один или список) или случайная
+      выборка sample_size проектов,
+    - полная декартова сетка × проекты собирается в одну матрицу и
+      оценивается одним predict на модель (для больших выборок — пакетами
+      до MAX_BATCH_ROWS строк),
+    - поверхность маржи и риска усредняется по проектам и кэшируется
+      на диске по хэшу моделей/данных, сетки и набора проектов.
+
+    Возвращает {"features", "values", "margin", "risk", "projects", "cached"};
+    margin/risk имеют форму (len(values[0]) [, len(values[1])]).
+    """
+    if not 1 <= len(grids) <= 2:
+        raise ValueError("Поддерживаются сетки по одному или двум признакам")
+    engine = engine or get_engine()
+    features = list(grids)
+    values = [list(v) for v in grids.values()]
+    projects = _select_projects(engine, base_index, sample_size, seed)
+    shape = tuple(len(v) for v in values)
+
+    cache_path = None
+    if cache_dir:
+        key = _cache_key(engine.fingerprint(), dict(zip(features, values)), projects)
+        cache_path = Path(cache_dir) / f"{key}.npz"
+        if cache_path.exists():
+            with np.load(cache_path) as cached:
+                return {
+                    "features": features,
+                    "values": values,
+                    "margin": cached["margin"],
+                    "risk": cached["risk"],
+                    "projects": projects,
+                    "cached": True,
+                }
+
+    # Плоская сетка: каждая строка — одна точка декартова произведения
+    encoded = [engine.encode_values(f, v) for f, v in zip(features, values)]
+    mesh = np.meshgrid(*encoded, indexing="ij")
+    grid_cols = [FEATURE_COLUMNS.index(f) for f in features]
+    grid_points = np.column_stack([m.ravel() for m in mesh])
+    G = len(grid_points)
+
+    base = engine.build_matrix([(p, None) for p in projects])
+    margin_sum = np.zeros(G)
+    risk_sum = np.zeros(G)
+    per_batch = max(1, MAX_BATCH_ROWS // G)
+    for start in range(0, len(base), per_batch):
+        block = base[start : start + per_batch]
+        X = np.repeat(block, G, axis=0)
+        X[:, grid_cols] = np.tile(grid_points, (len(block), 1))
+        margin, risk = engine.predict(X)
+        margin_sum += margin.reshape(len(block), G).sum(axis=0)
+        risk_sum += risk.reshape(len(block), G).sum(axis=0)
+
+    margin_surface = (margin_sum / len(base)).reshape(shape)
+    risk_surface = (risk_sum / len(base)).reshape(shape)
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, margin=margin_surface, risk=risk_surface)
+        os.replace(tmp_path, cache_path)
+
+    return {
+        "features": features,
+        "values": values,
+        "margin": margin_surface,
+        "risk": risk_surface,
+        "projects": projects,
+        "cached": False,
+    }
+
+
+def surface_to_frame(result: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Результат sensitivity_sweep в длинном формате: по строке на точку сетки.
+    """
+    mesh = np.meshgrid(*[np.asarray(v, dtype=object) for v in result["values"]], indexing="ij")
+    frame = pd.DataFrame({f: m.ravel() for f, m in zip(result["features"], mesh)})
+    frame["margin_pred"] = result["margin"].ravel()
+    frame["risk_prob"] = result["risk"].ravel()
+    return frame
+
+
+def _parse_grid(spec: str) -> tuple:
+    """
+    "name=start:stop:num" (равномерная сетка) или "name=a,b,c" (список).
+    """
+    name, _, values = spec.partition("=")
+    if not values:
+        raise argparse.ArgumentTypeError(f"Ожидается name=start:stop:num или name=a,b,c: {spec}")
+    if ":" in values:
+        start, stop, num = values.split(":")
+        return name, np.linspace(float(start), float(stop), int(num)).tolist()
+    items = values.split(",")
+    try:
+        return name, [float(v) for v in items]
+    except ValueError:
+        return name, items
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Анализ чувствительности маржи и риска")
+    parser.add_argument("--grid", action="append", type=_parse_grid, required=True,
+                        help="name=start:stop:num или name=a,b,c (1–2 раза)")
+    parser.add_argument("--base-index", type=int, nargs="*", default=[0])
+    parser.add_argument("--sample", type=int, default=None, help="размер случайной выборки проектов")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-path", default="data/raw/synthetic_construction_projects.csv")
+    parser.add_argument("--output", default=None, help="CSV с поверхностью (по умолчанию — вывод в консоль)")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args(argv)
+
+    engine = get_engine(data_path=args.data_path)
+    result = sensitivity_sweep(
+        dict(args.grid),
+        base_index=args.base_index,
+        sample_size=args.sample,
+        seed=args.seed,
+        engine=engine,
+        cache_dir=None if args.no_cache else DEFAULT_SWEEP_CACHE_DIR,
+    )
+    frame = surface_to_frame(result)
+    if args.output:
+        frame.to_csv(args.output, index=False)
+        print(f"Поверхность ({len(frame)} точек) сохранена в '{args.output}'")
+    else:
+        print(frame.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
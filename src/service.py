@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from .features import FEATURE_COLUMNS
+from .simulator import RESULT_COLUMNS, ScenarioEngine, get_engine
+
+
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_WORKERS = 2
+# Размер окна (запросов) для перцентилей задержки и пропускной способности
+STATS_WINDOW = 100_000
+# Пропускная способность — по запросам за последние секунды
+THROUGHPUT_WINDOW_S = 10.0
+
+Item = Tuple[str, Dict[str, Any]]
+
+# Обязательные поля тела запроса по типу
+REQUIRED_FIELDS = {
+    "simulate": ("base_index",),
+    "score": tuple(FEATURE_COLUMNS),
+}
+
+
+class LatencyStats:
+    """
+    Скользящее окно задержек запросов: p50/p99, пропускная способность
+    и средний размер пакета. Обновляется только из event loop.
+    """
+
+    def __init__(self, window: int = STATS_WINDOW) -> None:
+        self._latencies: deque = deque(maxlen=window)
+        self._finished: deque = deque(maxlen=window)
+        self._batch_sizes: deque = deque(maxlen=window)
+        self.n_requests = 0
+        self.n_errors = 0
+        self.started = time.perf_counter()
+
+    def record(self, latency: float, ok: bool = True) -> None:
+        self._latencies.append(latency)
+        self._finished.append(time.perf_counter())
+        self.n_requests += 1
+        self.n_errors += not ok
+
+    def record_batch(self, size: int) -> None:
+        self._batch_sizes.append(size)
+
+    def summary(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "requests": self.n_requests,
+            "errors": self.n_errors,
+            "uptime_s": time.perf_counter() - self.started,
+        }
+        if self._latencies:
+            latencies = np.asarray(self._latencies) * 1000
+            p50, p99 = np.percentile(latencies, [50, 99])
+            result.update(latency_p50_ms=float(p50), latency_p99_ms=float(p99))
+        now = time.perf_counter()
+        window = min(THROUGHPUT_WINDOW_S, now - self.started)
+        recent = np.asarray(self._finished)
+        n_recent = len(recent) - np.searchsorted(recent, now - window)
+        result["throughput_rps"] = float(n_recent / window) if window > 0 else 0.0
+        if self._batch_sizes:
+            result["mean_batch_size"] = float(np.mean(self._batch_sizes))
+        return result
+
+
+class MicroBatcher:
+    """
+    Объединение одновременных одиночных запросов в пакеты:
+    - первый запрос пакета ждёт не дольше max_wait_ms, пока наберётся
+      до max_batch_size запросов,
+    - пакет обрабатывается process(items) в пуле из n_workers потоков,
+      event loop тем временем собирает следующий пакет.
+
+    process возвращает по результату на элемент; исключение на месте
+    результата отдаётся только своему запросу.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        n_workers: int = DEFAULT_WORKERS,
+        stats: Optional[LatencyStats] = None,
+    ) -> None:
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.n_workers = n_workers
+        self.stats = stats
+        self._executor = ThreadPoolExecutor(max_workers=n_workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.n_workers)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            await self._slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch: list) -> None:
+        try:
+            if self.stats is not None:
+                self.stats.record_batch(len(batch))
+            items = [item for item, _ in batch]
+            loop = asyncio.get_running_loop()
+            try:
+                results = await loop.run_in_executor(self._executor, self.process, items)
+            except Exception as exc:
+                results = [exc] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+def _score_batch(engine: ScenarioEngine, items: Sequence[Item]) -> List[Dict[str, float]]:
+    """
+    Пакет запросов (what-if и обычный скоринг) — одна матрица
+    и один predict на модель.
+    """
+    simulate = [payload for kind, payload in items if kind == "simulate"]
+    score = [payload for kind, payload in items if kind == "score"]
+
+    parts = []
+    if simulate:
+        parts.append(engine.build_matrix([(int(p["base_index"]), None) for p in simulate]))
+        parts.append(
+            engine.build_matrix([(int(p["base_index"]), p.get("overrides")) for p in simulate])
+        )
+    if score:
+        parts.append(engine.encode_records(score))
+    margin, risk = engine.predict(np.vstack(parts))
+
+    n = len(simulate)
+    results = []
+    i_sim, i_score = 0, 2 * n
+    for kind, _ in items:
+        if kind == "simulate":
+            row = {
+                "original_margin_pred": margin[i_sim],
+                "scenario_margin_pred": margin[n + i_sim],
+                "original_risk_prob": risk[i_sim],
+                "scenario_risk_prob": risk[n + i_sim],
+            }
+            row["delta_margin"] = row["scenario_margin_pred"] - row["original_margin_pred"]
+            row["delta_risk"] = row["scenario_risk_prob"] - row["original_risk_prob"]
+            results.append({k: float(row[k]) for k in RESULT_COLUMNS if k != "base_index"})
+            i_sim += 1
+        else:
+            results.append({"margin_pred": float(margin[i_score]), "risk_prob": float(risk[i_score])})
+            i_score += 1
+    return results
+
+
+def score_items(engine: ScenarioEngine, items: Sequence[Item]) -> List[Any]:
+    """
+    Обработка пакета для MicroBatcher: при ошибке пакет делится пополам,
+    чтобы некорректный запрос получил свою ошибку, а остальные — ответ.
+    """
+    try:
+        return _score_batch(engine, items)
+    except Exception as exc:
+        if len(items) == 1:
+            return [exc]
+        mid = len(items) // 2
+        return score_items(engine, items[:mid]) + score_items(engine, items[mid:])
+
+
+def _validate(kind: str, payload: Any) -> Dict[str, Any]:
+    """
+    Проверка тела запроса до постановки в очередь: клиент получает 400
+    с понятным сообщением (missing field: base_index).
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Ожидается JSON-объект")
+    missing = [name for name in REQUIRED_FIELDS[kind] if name not in payload]
+    if missing:
+        raise ValueError(f"missing field: {', '.join(missing)}")
+    if kind == "simulate" and not isinstance(payload.get("overrides") or {}, dict):
+        raise ValueError("overrides: ожидается JSON-объект")
+    return payload
+
+
+def create_app(
+    engine: Optional[ScenarioEngine] = None,
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+    n_workers: int = DEFAULT_WORKERS,
+) -> Starlette:
+    """
+    ASGI-приложение сервиса скоринга:
+    - POST /simulate — {"base_index", "overrides"} -> ответ как у simulate_scenario,
+    - POST /score — признаки проекта (объект или список объектов)
+      -> {"margin_pred", "risk_prob"},
+    - GET /stats — p50/p99 задержки, пропускная способность, размер пакетов,
+    - GET /health.
+
+    Модели держатся в памяти (ScenarioEngine), одиночные запросы
+    объединяются в микропакеты.
+    """
+    engine = engine or get_engine()
+    stats = LatencyStats()
+    batcher = MicroBatcher(
+        partial(score_items, engine), max_batch_size, max_wait_ms, n_workers, stats
+    )
+
+    async def _handle(request: Request, kind: str) -> JSONResponse:
+        t0 = time.perf_counter()
+        ok = True
+        try:
+            payload = await request.json()
+            if kind == "score" and isinstance(payload, list):
+                items = [(kind, _validate(kind, p)) for p in payload]
+                result = list(await asyncio.gather(*[batcher.submit(item) for item in items]))
+            else:
+                result = await batcher.submit((kind, _validate(kind, payload)))
+            return JSONResponse(result)
+        except (KeyError, ValueError, IndexError, TypeError) as exc:
+            ok = False
+            message = exc.args[0] if isinstance(exc, KeyError) and exc.args else exc
+            return JSONResponse({"error": str(message)}, status_code=400)
+        finally:
+            stats.record(time.perf_counter() - t0, ok)
+
+    async def simulate(request: Request) -> JSONResponse:
+        return await _handle(request, "simulate")
+
+    async def score(request: Request) -> JSONResponse:
+        return await _handle(request, "score")
+
+    async def stats_endpoint(request: Request) -> JSONResponse:
+        return JSONResponse(stats.summary())
+
+    async def health(request: Request) -> JSONResponse:
+        return JSONResponse({"status": "ok", "projects": engine.n_projects})
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        engine.refresh()
+        await batcher.start()
+        yield
+        await batcher.stop()
+
+    return Starlette(
+        routes=[
+            Route("/simulate", simulate, methods=["POST"]),
+            Route("/score", score, methods=["POST"]),
+            Route("/stats", stats_endpoint, methods=["GET"]),
+            Route("/health", health, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="HTTP-сервис скоринга маржи и риска")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="потоки для predict")
+    parser.add_argument("--data-path", default="data/raw/synthetic_construction_projects.csv")
+    parser.add_argument("--margin-model-path", default="models/margin_model.pkl")
+    parser.add_argument("--risk-model-path", default="models/risk_model.pkl")
+    args = parser.parse_args(argv)
+
+    engine = get_engine(args.data_path, args.margin_model_path, args.risk_model_path)
+    app = create_app(engine, args.max_batch_size, args.max_wait_ms, args.workers)
+    print(f"Сервис скоринга: http://{args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
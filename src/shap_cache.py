@@ -0,0 +1,152 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict
+
+import numpy as np
+import pandas as pd
+
+from .dataset import dataset_hash, file_sha256, load_dataset, load_feature_matrix
+from .features import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, resolve_vocabulary, vocabulary_path_for
+from .profiling import span
+from .registry import load_model_for_path, model_source
+
+if TYPE_CHECKING:
+    import xgboost as xgb
+
+
+DEFAULT_SHAP_CACHE_DIR = "data/cache/shap"
+DEFAULT_CHUNK_ROWS = 50_000
+# Меньше кусков не дробим: накладные расходы DMatrix/потоков перевешивают
+MIN_CHUNK_ROWS = 1_000
+
+
+def _row_hashes(X: np.ndarray) -> np.ndarray:
+    """
+    64-битный хэш каждой строки матрицы признаков — по нему находятся
+    строки, для которых SHAP уже посчитан.
+    """
+    return pd.util.hash_pandas_object(pd.DataFrame(X), index=False).to_numpy()
+
+
+def _tree_shap(booster: "xgb.Booster", X: np.ndarray, chunk_rows: int, n_jobs: int) -> np.ndarray:
+    """
+    Точный TreeSHAP (tree_path_dependent) средствами XGBoost (pred_contribs)
+    по кускам в пуле потоков. Последняя колонка — base value.
+
+    Кусков не меньше n_jobs (не короче MIN_CHUNK_ROWS и не длиннее
+    chunk_rows), по потоку XGBoost на кусок; если кусок один — он
+    считается всеми n_jobs потоками XGBoost.
+    """
+    import xgboost as xgb
+
+    out = np.empty((len(X), X.shape[1] + 1), dtype=np.float32)
+    n_jobs = n_jobs if n_jobs > 0 else (os.cpu_count() or 1)
+    chunk_rows = min(chunk_rows, max(MIN_CHUNK_ROWS, -(-len(X) // n_jobs)))
+    starts = range(0, len(X), chunk_rows)
+
+    def run(start: int) -> None:
+        stop = min(start + chunk_rows, len(X))
+        dm = xgb.DMatrix(np.asarray(X[start:stop]), feature_names=booster.feature_names)
+        out[start:stop] = booster.predict(dm, pred_contribs=True)
+
+    if len(starts) == 1:
+        booster.set_param({"nthread": n_jobs})
+        run(0)
+        return out
+    booster.set_param({"nthread": 1})
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        list(pool.map(run, starts))
+    return out
+
+
+def _save_entry(path: Path, values: np.ndarray, base_values: np.ndarray, row_hash: np.ndarray) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    np.save(tmp / "values.npy", values)
+    np.save(tmp / "base_values.npy", base_values)
+    np.save(tmp / "row_hash.npy", row_hash)
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+
+def _load_entry(path: Path) -> Dict[str, np.ndarray]:
+    return {
+        name: np.load(path / f"{name}.npy", mmap_mode="r")
+        for name in ("values", "base_values", "row_hash")
+    }
+
+
+def compute_shap_values(
+    model_path: str,
+    data_path: str = "data/raw/synthetic_construction_projects.csv",
+    cache_dir: str = DEFAULT_SHAP_CACHE_DIR,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    n_jobs: int = -1,
+) -> Dict[str, Any]:
+    """
+    SHAP-значения модели для всего набора данных:
+    - всегда быстрый TreeSHAP по деревьям XGBoost (без интервенционного
+      или перестановочного fallback), куски считаются параллельно,
+    - результат (values + base_values) сохраняется в cache_dir
+      с ключом <хэш модели>-<хэш данных> (хэш модели — её указателя LATEST
+      в реестре, см. registry.model_source),
+    - при изменении данных пересчитываются только новые строки: остальные
+      берутся из прежнего кэша этой модели по хэшу строки.
+
+    Значения в пространстве выхода бустера (для риска — log-odds).
+    """
+    model_hash = file_sha256(model_source(model_path))[:16]
+    data_hash = dataset_hash(data_path)[:16]
+    entry_path = Path(cache_dir) / f"{model_hash}-{data_hash}"
+
+    if entry_path.exists():
+        cached = _load_entry(entry_path)
+        return {
+            "values": cached["values"],
+            "base_values": cached["base_values"],
+            "feature_names": FEATURE_COLUMNS,
+            "n_computed": 0,
+        }
+
+    df = load_dataset(data_path, columns=CATEGORICAL_COLUMNS)
+    vocabulary = resolve_vocabulary(df, vocabulary_path_for(model_path))
+    X = load_feature_matrix(data_path, vocabulary)
+    row_hash = _row_hashes(X)
+
+    values = np.empty((len(X), X.shape[1]), dtype=np.float32)
+    base_values = np.empty(len(X), dtype=np.float32)
+    todo = np.ones(len(X), dtype=bool)
+
+    # Переиспользование строк из предыдущего кэша той же модели
+    previous = sorted(Path(cache_dir).glob(f"{model_hash}-*"), key=lambda p: p.stat().st_mtime)
+    previous = [p for p in previous if p.is_dir() and not p.name.endswith(".tmp")]
+    if previous:
+        old = _load_entry(previous[-1])
+        known, first = np.unique(old["row_hash"], return_index=True)
+        pos = pd.Index(known).get_indexer(row_hash)
+        hit = pos >= 0
+        pos = first[pos]
+        values[hit] = old["values"][pos[hit]]
+        base_values[hit] = old["base_values"][pos[hit]]
+        todo = ~hit
+
+    booster = load_model_for_path(model_path).get_booster()
+    if todo.any():
+        with span("explain.tree_shap", rows=int(todo.sum()), cached=int((~todo).sum())):
+            contribs = _tree_shap(booster, X[todo], chunk_rows, n_jobs)
+        values[todo] = contribs[:, :-1]
+        base_values[todo] = contribs[:, -1]
+
+    _save_entry(entry_path, values, base_values, row_hash)
+    for old_path in previous:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    return {
+        "values": values,
+        "base_values": base_values,
+        "feature_names": FEATURE_COLUMNS,
+        "n_computed": int(todo.sum()),
+    }
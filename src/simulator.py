@@ -1,63 +1,429 @@
-from typing import Any, Dict, Optional
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
 
-import joblib
+import numpy as np
 import pandas as pd
 
-from .train_regressor import FEATURE_COLUMNS, _encode_categories
+from .dataset import (
+    DEFAULT_CACHE_DIR,
+    dataset_hash,
+    file_sha256,
+    file_signature,
+    load_dataset,
+    load_feature_matrix,
+    load_table,
+)
+from .features import (
+    CATEGORICAL_COLUMNS,
+    FEATURE_COLUMNS,
+    encode_column,
+    resolve_vocabulary,
+    vocabulary_path_for,
+)
+from .flat_trees import FlatForest
+from .profiling import span
+from .registry import load_model_for_path, model_source
 
 
-def simulate_scenario(
-    base_index: int,
-    overrides: Optional[Dict[str, Any]] = None,
-    data_path: str = "data/raw/synthetic_construction_projects.csv",
-    margin_model_path: str = "models/margin_model.pkl",
-    risk_model_path: str = "models/risk_model.pkl",
-) -> Dict[str, Any]:
+# До такого числа строк predict идёт через плоские деревья (FlatForest):
+# на малых пакетах они быстрее XGBoost, на больших — медленнее
+FLAT_MAX_ROWS = 32
+
+Scenarios = Union[pd.DataFrame, Iterable[Tuple[int, Optional[Dict[str, Any]]]]]
+
+RESULT_COLUMNS = [
+    "base_index",
+    "original_margin_pred",
+    "scenario_margin_pred",
+    "original_risk_prob",
+    "scenario_risk_prob",
+    "delta_margin",
+    "delta_risk",
+]
+
+
+def _normalize_scenarios(scenarios: Scenarios) -> Tuple[np.ndarray, pd.DataFrame]:
     """
-    What-if симуляция:
-    - берём проект с индексом base_index,
-    - применяем overrides к его признакам,
-    - пересчитываем прогноз маржи и риска перерасхода.
+    Приводит сценарии к виду (base_index[], таблица overrides).
+    Пропуски (NaN) в таблице overrides означают «признак не меняется».
     """
-    overrides = overrides or {}
+    if isinstance(scenarios, pd.DataFrame):
+        if "base_index" not in scenarios.columns:
+            raise KeyError("В таблице сценариев нет колонки base_index")
+        base_idx = scenarios["base_index"].to_numpy(dtype=np.int64)
+        overrides = scenarios.drop(columns="base_index").reset_index(drop=True)
+        return base_idx, overrides
+
+    pairs = list(scenarios)
+    base_idx = np.fromiter((b for b, _ in pairs), dtype=np.int64, count=len(pairs))
+    overrides = pd.DataFrame.from_records([o or {} for _, o in pairs], index=range(len(pairs)))
+    return base_idx, overrides
 
-    df = pd.read_csv(data_path)
-    if base_index < 0 or base_index >= len(df):
+
+def _build_scenario_matrix(
+    X_base: np.ndarray,
+    classes: Dict[str, pd.Index],
+    columns: pd.Index,
+    base_idx: np.ndarray,
+    overrides: pd.DataFrame,
+) -> np.ndarray:
+    """
+    Собирает закодированную матрицу сценариев: строки базовых проектов
+    + overrides, применённые поколоночно.
+    """
+    if len(base_idx) and (base_idx.min() < 0 or base_idx.max() >= len(X_base)):
         raise IndexError("base_index вне диапазона данных")
 
-    original_row = df.iloc[base_index].copy()
-    scenario_row = original_row.copy()
-    for k, v in overrides.items():
-        if k not in df.columns:
-            raise KeyError(f"Неизвестный признак в overrides: {k}")
-        scenario_row[k] = v
+    X = X_base[base_idx]
+    for col in overrides.columns:
+        if col not in columns:
+            raise KeyError(f"Неизвестный признак в overrides: {col}")
+        if col not in FEATURE_COLUMNS:
+            # Признак есть в данных, но модель его не использует
+            continue
+
+        values = overrides[col]
+        mask = values.notna().to_numpy()
+        if not mask.any():
+            continue
+
+        j = FEATURE_COLUMNS.index(col)
+        if col in classes:
+            X[mask, j] = encode_column(values[mask].to_numpy(), classes[col], col)
+        else:
+            X[mask, j] = values[mask].to_numpy(dtype=np.float32)
+    return X
+
+
+def _predict_state(state: Dict[str, Any], X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Прогноз маржи и риска по снимку состояния движка: небольшие пакеты
+    (слайдеры, одиночные what-if) считаются плоскими деревьями без
+    накладных расходов predict XGBoost, большие — самим XGBoost.
+    """
+    flat = state.get("margin_flat"), state.get("risk_flat")
+    if len(X) <= FLAT_MAX_ROWS and None not in flat:
+        margin = flat[0].predict(X)
+        risk = flat[1].predict(X)
+    else:
+        margin = state["margin_model"].predict(X)
+        risk = state["risk_model"].predict_proba(X)[:, 1]
+    return margin.astype(np.float64), risk.astype(np.float64)
+
+
+def _flatten(model) -> Optional[FlatForest]:
+    try:
+        return FlatForest.from_model(model)
+    except (ValueError, AttributeError):
+        # Модель не поддерживается плоским вычислителем — только XGBoost
+        return None
+
+
+def _score_scenarios(
+    X_base: np.ndarray,
+    X_scenario: np.ndarray,
+    base_idx: np.ndarray,
+    state: Dict[str, Any],
+) -> pd.DataFrame:
+    """
+    Один predict на модель: исходные проекты (без повторов) и сценарии
+    оцениваются одной матрицей.
+    """
+    uniq, inverse = np.unique(base_idx, return_inverse=True)
+    X = np.vstack([X_base[uniq], X_scenario])
+
+    margin, risk = _predict_state(state, X)
+
+    n_uniq = len(uniq)
+    original_margin = margin[:n_uniq][inverse]
+    original_risk = risk[:n_uniq][inverse]
+    scenario_margin = margin[n_uniq:]
+    scenario_risk = risk[n_uniq:]
+
+    return pd.DataFrame(
+        {
+            "base_index": base_idx,
+            "original_margin_pred": original_margin,
+            "scenario_margin_pred": scenario_margin,
+            "original_risk_prob": original_risk,
+            "scenario_risk_prob": scenario_risk,
+            "delta_margin": scenario_margin - original_margin,
+            "delta_risk": scenario_risk - original_risk,
+        },
+        columns=RESULT_COLUMNS,
+    )
+
+
+class ScenarioEngine:
+    """
+    Долгоживущий what-if движок:
+    - модели (последние версии реестра, нативный формат XGBoost),
+      закодированная матрица признаков и словарь категорий (сохранённый
+      при обучении рядом с моделями) загружаются один раз и держатся
+      в памяти,
+    - перед каждым запросом проверяется подпись файлов (mtime/размер;
+      для моделей — указателя LATEST реестра), перезагружается только
+      изменившийся файл,
+    - при check_hash=True после смены mtime дополнительно сравнивается
+      sha256 содержимого, и «пустое» касание файла не вызывает перезагрузку,
+    - объект можно разделять между потоками: загрузка идёт под блокировкой,
+      запросы работают с неизменяемым снимком состояния.
+    """
+
+    def __init__(
+        self,
+        data_path: str = "data/raw/synthetic_construction_projects.csv",
+        margin_model_path: str = "models/margin_model.pkl",
+        risk_model_path: str = "models/risk_model.pkl",
+        vocabulary_path: Optional[str] = None,
+        check_hash: bool = False,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+    ) -> None:
+        self.data_path = data_path
+        self.margin_model_path = margin_model_path
+        self.risk_model_path = risk_model_path
+        self.vocabulary_path = vocabulary_path or vocabulary_path_for(margin_model_path)
+        self.check_hash = check_hash
+        self.cache_dir = cache_dir
+
+        self._lock = threading.RLock()
+        self._signatures: Dict[str, Tuple[Any, ...]] = {}
+        self._state: Dict[str, Any] = {}
+
+    def _is_stale(self, path: str) -> bool:
+        old = self._signatures.get(path)
+        if old is None:
+            return True
+        st = os.stat(path)
+        if (st.st_mtime_ns, st.st_size) == old[:2]:
+            return False
+        if not self.check_hash:
+            return True
+        new = file_signature(path, with_hash=True)
+        if new[2] == old[2]:
+            # Содержимое то же — запоминаем новый mtime, не перезагружая
+            self._signatures[path] = new
+            return False
+        return True
 
-    # Подготовка данных
-    df_enc = _encode_categories(df)
-    original_enc = df_enc.iloc[base_index][FEATURE_COLUMNS]
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Перезагружает изменившиеся файлы. Возвращает True, если что-то
+        было перезагружено.
+        """
+        with self._lock:
+            state = dict(self._state)
+            reloaded = False
 
-    df_scenario = df.copy()
-    df_scenario.loc[base_index] = scenario_row
-    scenario_enc = _encode_categories(df_scenario).iloc[base_index][FEATURE_COLUMNS]
+            vocabulary_changed = False
+            if os.path.exists(self.vocabulary_path) and (
+                force or self._is_stale(self.vocabulary_path)
+            ):
+                self._signatures[self.vocabulary_path] = file_signature(
+                    self.vocabulary_path, self.check_hash
+                )
+                vocabulary_changed = True
 
-    margin_model = joblib.load(margin_model_path)
-    risk_model = joblib.load(risk_model_path)
+            if force or vocabulary_changed or self._is_stale(self.data_path):
+                self._signatures[self.data_path] = file_signature(self.data_path, self.check_hash)
+                with span("simulator.load_data") as s:
+                    df = load_dataset(self.data_path, CATEGORICAL_COLUMNS, self.cache_dir)
+                    vocabulary = resolve_vocabulary(df, self.vocabulary_path)
+                    state["X_base"] = load_feature_matrix(self.data_path, vocabulary, self.cache_dir)
+                    state["classes"] = {c: pd.Index(v) for c, v in vocabulary.items()}
+                    state["columns"] = pd.Index(load_table(self.data_path, cache_dir=self.cache_dir).column_names)
+                    s.rows = len(state["X_base"])
+                reloaded = True
 
-    original_margin_pred = float(margin_model.predict([original_enc])[0])
-    scenario_margin_pred = float(margin_model.predict([scenario_enc])[0])
+            for key, path in (
+                ("margin_model", self.margin_model_path),
+                ("risk_model", self.risk_model_path),
+            ):
+                # Модель из реестра меняется вместе с указателем LATEST
+                source = model_source(path)
+                if force or self._is_stale(source):
+                    self._signatures[source] = file_signature(source, self.check_hash)
+                    with span(f"simulator.load_{key}"):
+                        state[key] = load_model_for_path(path)
+                        state[key.replace("model", "flat")] = _flatten(state[key])
+                    reloaded = True
 
-    original_risk_prob = float(risk_model.predict_proba([original_enc])[0, 1])
-    scenario_risk_prob = float(risk_model.predict_proba([scenario_enc])[0, 1])
+            if reloaded:
+                state["fingerprint"] = None
+                self._state = state
+            return reloaded
 
-    result = {
-        "original_margin_pred": original_margin_pred,
-        "scenario_margin_pred": scenario_margin_pred,
-        "original_risk_prob": original_risk_prob,
-        "scenario_risk_prob": scenario_risk_prob,
-        "delta_margin": scenario_margin_pred - original_margin_pred,
-        "delta_risk": scenario_risk_prob - original_risk_prob,
-    }
+    def _snapshot(self) -> Dict[str, Any]:
+        self.refresh()
+        return self._state
 
-    return result
+    def fingerprint(self) -> str:
+        """
+        sha256 текущих данных, моделей и словаря категорий — ключ
+        для дисковых кэшей производных результатов.
+        """
+        state = self._snapshot()
+        with self._lock:
+            if state.get("fingerprint") is None:
+                parts = [dataset_hash(self.data_path, self.cache_dir)]
+                for path in (
+                    model_source(self.margin_model_path),
+                    model_source(self.risk_model_path),
+                    self.vocabulary_path,
+                ):
+                    if os.path.exists(path):
+                        parts.append(file_sha256(path))
+                state["fingerprint"] = hashlib.sha256("|".join(parts).encode()).hexdigest()
+            return state["fingerprint"]
 
+    @property
+    def n_projects(self) -> int:
+        return len(self._snapshot()["X_base"])
 
+    def categories(self) -> Dict[str, list]:
+        """
+        Словарь категорий модели: признак -> значения (код = позиция).
+        """
+        return {c: v.tolist() for c, v in self._snapshot()["classes"].items()}
+
+    def feature_summary(self) -> pd.DataFrame:
+        """
+        min / max / mean признаков по всему набору (в кодировке модели).
+        """
+        X = self._snapshot()["X_base"]
+        return pd.DataFrame(
+            {"min": X.min(axis=0), "max": X.max(axis=0), "mean": X.mean(axis=0, dtype=np.float64)},
+            index=FEATURE_COLUMNS,
+        )
+
+    def build_matrix(self, scenarios: Scenarios) -> np.ndarray:
+        """
+        Закодированная матрица признаков сценариев (без предсказания).
+        """
+        base_idx, overrides = _normalize_scenarios(scenarios)
+        state = self._snapshot()
+        return _build_scenario_matrix(
+            state["X_base"], state["classes"], state["columns"], base_idx, overrides
+        )
+
+    def encode_values(self, feature: str, values) -> np.ndarray:
+        """
+        Значения признака в кодировке модели (категории — по словарю).
+        """
+        if feature not in FEATURE_COLUMNS:
+            raise KeyError(f"Неизвестный признак: {feature}")
+        classes = self._snapshot()["classes"]
+        if feature in classes:
+            codes = encode_column(np.asarray(values, dtype=object), classes[feature], feature)
+            return codes.astype(np.float32)
+        return np.asarray(values, dtype=np.float32)
+
+    def encode_records(self, records: Iterable[Dict[str, Any]]) -> np.ndarray:
+        """
+        Матрица признаков для полностью заданных проектов (без базового
+        проекта из истории): все FEATURE_COLUMNS обязательны.
+        """
+        frame = pd.DataFrame.from_records(list(records))
+        missing = [c for c in FEATURE_COLUMNS if c not in frame.columns]
+        if missing:
+            raise KeyError(f"Не заданы признаки: {missing}")
+        classes = self._snapshot()["classes"]
+        X = np.empty((len(frame), len(FEATURE_COLUMNS)), dtype=np.float32)
+        for j, col in enumerate(FEATURE_COLUMNS):
+            if col in classes:
+                X[:, j] = encode_column(frame[col].to_numpy(), classes[col], col)
+            else:
+                X[:, j] = frame[col].to_numpy(dtype=np.float32)
+        return X
+
+    def predict(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Прогноз маржи и вероятности перерасхода для готовой матрицы признаков.
+        """
+        return _predict_state(self._snapshot(), X)
+
+    def simulate_many(self, scenarios: Scenarios) -> pd.DataFrame:
+        """
+        Пакетная what-if симуляция (см. simulate_scenarios).
+        """
+        base_idx, overrides = _normalize_scenarios(scenarios)
+        state = self._snapshot()
+        with span("simulator.simulate_many", rows=len(base_idx)):
+            X_scenario = _build_scenario_matrix(
+                state["X_base"], state["classes"], state["columns"], base_idx, overrides
+            )
+            return _score_scenarios(state["X_base"], X_scenario, base_idx, state)
+
+    def simulate(self, base_index: int, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        What-if симуляция одного сценария (см. simulate_scenario).
+        """
+        row = self.simulate_many([(base_index, overrides)]).iloc[0]
+        return {k: float(row[k]) for k in RESULT_COLUMNS if k != "base_index"}
+
+
+_ENGINES: Dict[Tuple[str, str, str], ScenarioEngine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_engine(
+    data_path: str = "data/raw/synthetic_construction_projects.csv",
+    margin_model_path: str = "models/margin_model.pkl",
+    risk_model_path: str = "models/risk_model.pkl",
+) -> ScenarioEngine:
+    """
+    Общий для процесса ScenarioEngine на заданный набор файлов.
+    """
+    key = (
+        os.path.abspath(data_path),
+        os.path.abspath(margin_model_path),
+        os.path.abspath(risk_model_path),
+    )
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            engine = ScenarioEngine(data_path, margin_model_path, risk_model_path)
+            _ENGINES[key] = engine
+        return engine
+
+
+def simulate_scenarios(
+    scenarios: Scenarios,
+    data_path: str = "data/raw/synthetic_construction_projects.csv",
+    margin_model_path: str = "models/margin_model.pkl",
+    risk_model_path: str = "models/risk_model.pkl",
+) -> pd.DataFrame:
+    """
+    Пакетная what-if симуляция:
+    - scenarios — список пар (base_index, overrides) или DataFrame
+      с колонкой base_index и колонками изменяемых признаков (NaN = без изменений),
+    - все сценарии собираются в одну матрицу,
+    - на каждую модель выполняется один векторизованный predict.
+
+    Данные и модели берутся из общего ScenarioEngine и перечитываются
+    только при изменении файлов.
+
+    Возвращает DataFrame (по строке на сценарий) с прогнозами и дельтами
+    маржи и риска перерасхода.
+    """
+    engine = get_engine(data_path, margin_model_path, risk_model_path)
+    return engine.simulate_many(scenarios)
+
+
+def simulate_scenario(
+    base_index: int,
+    overrides: Optional[Dict[str, Any]] = None,
+    data_path: str = "data/raw/synthetic_construction_projects.csv",
+    margin_model_path: str = "models/margin_model.pkl",
+    risk_model_path: str = "models/risk_model.pkl",
+) -> Dict[str, Any]:
+    """
+    What-if симуляция:
+    - берём проект с индексом base_index,
+    - применяем overrides к его признакам,
+    - пересчитываем прогноз маржи и риска перерасхода.
+    """
+    engine = get_engine(data_path, margin_model_path, risk_model_path)
+    return engine.simulate(base_index, overrides)
@@ -1,58 +1,144 @@
-from pathlib import Path
+from typing import Optional
 
-import joblib
+import numpy as np
 import pandas as pd
 from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
 from xgboost import XGBClassifier
 
-from .train_regressor import FEATURE_COLUMNS, _encode_categories
+from .cross_validation import cv_metrics, resolve_split
+from .dataset import load_dataset, load_feature_matrix
+from .external_memory import DEFAULT_CHUNK_ROWS, iter_test_predictions, open_external, train_booster
+from .features import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, fit_category_vocabulary
+from .profiling import span
+from .registry import tuned_params
+from .train_regressor import SPLIT_RANDOM_STATE, TEST_SIZE, _save_model
+
+
+CLASSIFIER_PARAMS = {
+    "n_estimators": 200,
+    "max_depth": 5,
+    "learning_rate": 0.1,
+    "subsample": 0.9,
+    "colsample_bytree": 0.9,
+    "random_state": 42,
+    "eval_metric": "logloss",
+}
+
+
+def _make_classifier(n_jobs: int = -1, params=None) -> XGBClassifier:
+    return XGBClassifier(**(params or CLASSIFIER_PARAMS), n_jobs=n_jobs)
+
+
+def _evaluate_classifier(clf: XGBClassifier, X_test, y_test) -> dict:
+    y_proba = clf.predict_proba(X_test)[:, 1]
+    y_pred = (y_proba >= 0.5).astype(int)
+
+    roc_auc = roc_auc_score(y_test, y_proba)
+    cm = confusion_matrix(y_test, y_pred)
+    report = classification_report(y_test, y_pred)
+    return {"roc_auc": roc_auc, "confusion_matrix": cm, "classification_report": report}
+
+
+def _train_classifier_external(data_path: str, chunk_rows: int, params=None, n_jobs: int = -1):
+    """
+    Out-of-core обучение. Для ROC-AUC в памяти держатся только
+    метки и вероятности тестовой выборки.
+    """
+    X, table, vocabulary = open_external(data_path)
+    y = table.column("budget_overrun")
+    params = params or CLASSIFIER_PARAMS
+    booster = train_booster(X, y, params, "binary:logistic", chunk_rows, n_jobs)
+
+    y_test, y_proba = [], []
+    for y_true, proba in iter_test_predictions(booster, X, y, chunk_rows):
+        y_test.append(y_true.astype(np.int8))
+        y_proba.append(proba)
+    y_test = np.concatenate(y_test)
+    y_proba = np.concatenate(y_proba)
+
+    clf = XGBClassifier(**params, n_jobs=n_jobs)
+    clf.load_model(bytearray(booster.save_raw("ubj")))
+    y_pred = (y_proba >= 0.5).astype(int)
+    metrics = {
+        "roc_auc": roc_auc_score(y_test, y_proba),
+        "confusion_matrix": confusion_matrix(y_test, y_pred),
+        "classification_report": classification_report(y_test, y_pred),
+    }
+    return clf, vocabulary, metrics
 
 
 def train_classifier(
     data_path: str = "data/raw/synthetic_construction_projects.csv",
     model_path: str = "models/risk_model.pkl",
+    external_memory: bool = False,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    n_jobs: int = -1,
+    use_tuned: bool = False,
+    cv_folds: int = 0,
+    cv_split: str = "auto",
+    cv_group_column: Optional[str] = None,
+    cv_time_column: Optional[str] = None,
 ) -> dict:
     """
-    Обучение модели риска перерасхода бюджета.
+    Обучение модели риска перерасхода бюджета
+    (словарь категорий сохраняется рядом с моделью).
     Возвращает ROC-AUC и confusion matrix.
+
+    external_memory=True — обучение с ограниченной памятью: XGBoost получает
+    данные кусками по chunk_rows строк (hist + external-memory DMatrix).
+    n_jobs — потоки XGBoost (-1 — все ядра).
+    use_tuned=True — гиперпараметры из последнего подбора в реестре
+    (см. src/tuning.py), если он был на тех же данных.
+    cv_folds > 0 — дополнительно k-fold кросс-валидация (cv_split: auto,
+    kfold, stratified, group — по колонке cv_group_column, time — по
+    cv_time_column или порядку строк; auto с колонкой выбирает group/time,
+    см. src/cross_validation.py), итог в metrics["cv"]; только для обучения
+    в памяти. Несовместимые cv_split и колонка — ValueError до обучения.
     """
-    df = pd.read_csv(data_path)
-    df_enc = _encode_categories(df)
+    if cv_folds:
+        cv_split = resolve_split("risk", cv_split, cv_group_column, cv_time_column)
+    params = tuned_params(model_path, CLASSIFIER_PARAMS, data_path) if use_tuned else CLASSIFIER_PARAMS
+    if external_memory:
+        with span("train_classifier.external"):
+            clf, vocabulary, metrics = _train_classifier_external(data_path, chunk_rows, params, n_jobs)
+        with span("train_classifier.save"):
+            _save_model(clf, model_path, vocabulary, metrics, data_path)
+        print(f"Risk model saved to {model_path}")
+        print(f"ROC-AUC: {metrics['roc_auc']:.4f}")
+        print(f"Confusion matrix:\n{metrics['confusion_matrix']}")
+        return metrics
 
-    X = df_enc[FEATURE_COLUMNS]
-    y = df_enc["budget_overrun"]
+    with span("train_classifier.load") as s:
+        df = load_dataset(data_path, columns=CATEGORICAL_COLUMNS + ["budget_overrun"])
+        vocabulary = fit_category_vocabulary(df)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+        X = pd.DataFrame(
+            load_feature_matrix(data_path, vocabulary), columns=FEATURE_COLUMNS, copy=False
+        )
+        y = df["budget_overrun"]
+        s.rows = len(X)
 
-    clf = XGBClassifier(
-        n_estimators=200,
-        max_depth=5,
-        learning_rate=0.1,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        random_state=42,
-        n_jobs=-1,
-        eval_metric="logloss",
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZE, random_state=SPLIT_RANDOM_STATE, stratify=y
     )
-    clf.fit(X_train, y_train)
-
-    y_proba = clf.predict_proba(X_test)[:, 1]
-    y_pred = (y_proba >= 0.5).astype(int)
 
-    roc_auc = roc_auc_score(y_test, y_proba)
-    cm = confusion_matrix(y_test, y_pred)
-    report = classification_report(y_test, y_pred)
+    clf = _make_classifier(n_jobs=n_jobs, params=params)
+    with span("train_classifier.fit", rows=len(X_train)):
+        clf.fit(X_train, y_train)
 
-    Path(model_path).parent.mkdir(parents=True, exist_ok=True)
-    joblib.dump(clf, model_path)
+    with span("train_classifier.evaluate", rows=len(X_test)):
+        metrics = _evaluate_classifier(clf, X_test, y_test)
+    if cv_folds:
+        with span("train_classifier.cv", folds=cv_folds):
+            metrics["cv"] = cv_metrics(
+                data_path, "risk", cv_folds, cv_split, params, cv_group_column, cv_time_column
+            )
+    with span("train_classifier.save"):
+        _save_model(clf, model_path, vocabulary, metrics, data_path)
 
-    metrics = {"roc_auc": roc_auc, "confusion_matrix": cm, "classification_report": report}
     print(f"Risk model saved to {model_path}")
-    print(f"ROC-AUC: {roc_auc:.4f}")
-    print(f"Confusion matrix:\n{cm}")
+    print(f"ROC-AUC: {metrics['roc_auc']:.4f}")
+    print(f"Confusion matrix:\n{metrics['confusion_matrix']}")
     return metrics
 
@@ -0,0 +1,138 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from .dataset import load_dataset, load_feature_matrix
+from .features import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, fit_category_vocabulary
+from .profiling import span
+from .registry import tuned_params
+from .train_classifier import CLASSIFIER_PARAMS, _evaluate_classifier, _make_classifier
+from .train_regressor import (
+    REGRESSOR_PARAMS,
+    SPLIT_RANDOM_STATE,
+    TEST_SIZE,
+    _evaluate_regressor,
+    _make_regressor,
+    _save_model,
+)
+
+
+def _fit_stage(
+    name, model, X_train, y_train, X_test, y_test, evaluate, model_path, vocabulary, data_path
+) -> Dict[str, Any]:
+    """
+    fit + оценка + сохранение одной модели с замером времени этапов
+    (этапы train.<name>.fit / evaluate / save).
+    """
+    timings = {}
+    with span(f"train.{name}.fit", rows=len(X_train)) as s:
+        model.fit(X_train, y_train)
+    timings["fit"] = s.wall_s
+
+    with span(f"train.{name}.evaluate", rows=len(X_test)) as s:
+        metrics = evaluate(model, X_test, y_test)
+    timings["evaluate"] = s.wall_s
+
+    with span(f"train.{name}.save") as s:
+        _save_model(model, model_path, vocabulary, metrics, data_path)
+    timings["save"] = s.wall_s
+    return {"metrics": metrics, "timings": timings}
+
+
+def train_models(
+    data_path: str = "data/raw/synthetic_construction_projects.csv",
+    margin_model_path: str = "models/margin_model.pkl",
+    risk_model_path: str = "models/risk_model.pkl",
+    n_jobs: Optional[int] = None,
+    use_tuned: bool = False,
+) -> Dict[str, Any]:
+    """
+    Обучение моделей маржи и риска за один проход:
+    - данные загружаются и кодируются один раз,
+    - одно разбиение train/test (стратифицированное по budget_overrun)
+      используется для обеих целей,
+    - регрессор и классификатор обучаются параллельно, каждому
+      выделяется n_jobs потоков (по умолчанию половина ядер),
+    - use_tuned=True — гиперпараметры из последнего подбора в реестре
+      (src/tuning.py), если он был на тех же данных.
+
+    Возвращает метрики обеих моделей и время по этапам (секунды).
+    """
+    timings: Dict[str, Any] = {}
+    t_start = time.perf_counter()
+
+    with span("train.load") as s:
+        df = load_dataset(data_path, columns=CATEGORICAL_COLUMNS + ["actual_margin", "budget_overrun"])
+        vocabulary = fit_category_vocabulary(df)
+        X = pd.DataFrame(
+            load_feature_matrix(data_path, vocabulary), columns=FEATURE_COLUMNS, copy=False
+        )
+        s.rows = len(X)
+    timings["load"] = s.wall_s
+
+    with span("train.split", rows=len(df)) as s:
+        train_idx, test_idx = train_test_split(
+            np.arange(len(df)),
+            test_size=TEST_SIZE,
+            random_state=SPLIT_RANDOM_STATE,
+            stratify=df["budget_overrun"],
+        )
+        X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
+        y = df[["actual_margin", "budget_overrun"]]
+        y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
+    timings["split"] = s.wall_s
+
+    if n_jobs is None:
+        n_jobs = max(1, (os.cpu_count() or 2) // 2)
+    margin_params, risk_params = REGRESSOR_PARAMS, CLASSIFIER_PARAMS
+    if use_tuned:
+        margin_params = tuned_params(margin_model_path, REGRESSOR_PARAMS, data_path)
+        risk_params = tuned_params(risk_model_path, CLASSIFIER_PARAMS, data_path)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        margin_future = pool.submit(
+            _fit_stage,
+            name="margin",
+            model=_make_regressor(n_jobs=n_jobs, params=margin_params),
+            X_train=X_train,
+            y_train=y_train["actual_margin"],
+            X_test=X_test,
+            y_test=y_test["actual_margin"],
+            evaluate=_evaluate_regressor,
+            model_path=margin_model_path,
+            vocabulary=vocabulary,
+            data_path=data_path,
+        )
+        risk_future = pool.submit(
+            _fit_stage,
+            name="risk",
+            model=_make_classifier(n_jobs=n_jobs, params=risk_params),
+            X_train=X_train,
+            y_train=y_train["budget_overrun"],
+            X_test=X_test,
+            y_test=y_test["budget_overrun"],
+            evaluate=_evaluate_classifier,
+            model_path=risk_model_path,
+            vocabulary=vocabulary,
+            data_path=data_path,
+        )
+        margin = margin_future.result()
+        risk = risk_future.result()
+    timings["train"] = time.perf_counter() - t0
+    timings["margin"] = margin["timings"]
+    timings["risk"] = risk["timings"]
+    timings["total"] = time.perf_counter() - t_start
+
+    print(f"Margin model saved to {margin_model_path}")
+    print(f"MAE: {margin['metrics']['mae']:.4f}, RMSE: {margin['metrics']['rmse']:.4f}")
+    print(f"Risk model saved to {risk_model_path}")
+    print(f"ROC-AUC: {risk['metrics']['roc_auc']:.4f}")
+    print(f"Training wall time: {timings['total']:.2f}s")
+
+    return {"margin": margin["metrics"], "risk": risk["metrics"], "timings": timings}
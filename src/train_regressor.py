@@ -1,88 +1,176 @@
+import os
+import tempfile
 from pathlib import Path
+from typing import Optional
 
 import math
 import joblib
+import numpy as np
 import pandas as pd
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
 from xgboost import XGBRegressor
 
+from .cross_validation import cv_metrics, resolve_split
+from .dataset import dataset_hash, load_dataset, load_feature_matrix
+from .external_memory import DEFAULT_CHUNK_ROWS, iter_test_predictions, open_external, train_booster
+# FEATURE_COLUMNS/_encode_categories исторически импортируются отсюда (ноутбуки)
+from .features import (
+    CATEGORICAL_COLUMNS,
+    FEATURE_COLUMNS,
+    _encode_categories,
+    fit_category_vocabulary,
+    save_category_vocabulary,
+    vocabulary_path_for,
+)
+from .profiling import span
+from .registry import model_name_for, register_model, registry_dir_for, tuned_params
 
-FEATURE_COLUMNS = [
-    "district_class",
-    "land_price_per_m2",
-    "soil_complexity",
-    "site_accessibility",
-    "land_area_m2",
-    "house_area_m2",
-    "design_complexity",
-    "materials_class",
-    "planned_duration_days",
-    "planned_budget",
-    "crew_experience_years",
-    "crew_efficiency_score",
-    "crew_current_load",
-    "supplier_reliability_score",
-    "delivery_distance_km",
-    "weather_season",
-    "material_price_index",
-    "mortgage_rate",
-    "market_demand_index",
-    "client_type",
-    "labor_cost_index",
-]
-
-
-def _encode_categories(df: pd.DataFrame) -> pd.DataFrame:
-    cat_cols = ["district_class", "materials_class", "weather_season", "client_type"]
-    encoded = df.copy()
-    for c in cat_cols:
-        le = LabelEncoder()
-        encoded[c] = le.fit_transform(encoded[c])
-    return encoded
+
+# Отложенная тестовая выборка тренеров (train_classifier и train_pipeline —
+# то же, но со стратификацией по budget_overrun); src/tuning.py исключает
+# эти строки из валидации
+TEST_SIZE = 0.2
+SPLIT_RANDOM_STATE = 42
+
+REGRESSOR_PARAMS = {
+    "n_estimators": 200,
+    "max_depth": 5,
+    "learning_rate": 0.1,
+    "subsample": 0.9,
+    "colsample_bytree": 0.9,
+    "random_state": 42,
+}
+
+
+def _make_regressor(n_jobs: int = -1, params=None) -> XGBRegressor:
+    return XGBRegressor(**(params or REGRESSOR_PARAMS), n_jobs=n_jobs)
+
+
+def _evaluate_regressor(reg: XGBRegressor, X_test, y_test) -> dict:
+    y_pred = reg.predict(X_test)
+    mae = mean_absolute_error(y_test, y_pred)
+    mse = mean_squared_error(y_test, y_pred)
+    rmse = math.sqrt(mse)
+    return {"mae": mae, "rmse": rmse}
+
+
+def _save_model(model, model_path: str, vocabulary, metrics=None, data_path=None) -> None:
+    """
+    Модель + словарь категорий рядом с ней:
+    - новая версия в реестре models/registry (нативный формат XGBoost,
+      метрики, хэш обучающих данных, признаки и словарь) — основной
+      артефакт: его загружают ScenarioEngine, кэш SHAP и explainability,
+    - pickle по привычному пути — только экспорт для совместимости
+      (ноутбуки, внешние скрипты); заменяется атомарно.
+    """
+    Path(model_path).parent.mkdir(parents=True, exist_ok=True)
+    register_model(
+        model_name_for(model_path),
+        model,
+        metrics=metrics,
+        vocabulary=vocabulary,
+        data_hash=dataset_hash(data_path) if data_path else None,
+        registry_dir=registry_dir_for(model_path),
+    )
+    fd, tmp_path = tempfile.mkstemp(dir=Path(model_path).parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        joblib.dump(model, f)
+    os.replace(tmp_path, model_path)
+    save_category_vocabulary(vocabulary, vocabulary_path_for(model_path))
+
+
+def _train_regressor_external(data_path: str, chunk_rows: int, params=None, n_jobs: int = -1):
+    """
+    Out-of-core обучение: данные читаются кусками, метрики считаются
+    потоково по тестовым кускам.
+    """
+    X, table, vocabulary = open_external(data_path)
+    y = table.column("actual_margin")
+    params = params or REGRESSOR_PARAMS
+    booster = train_booster(X, y, params, "reg:squarederror", chunk_rows, n_jobs)
+
+    abs_sum = sq_sum = 0.0
+    n = 0
+    for y_true, y_pred in iter_test_predictions(booster, X, y, chunk_rows):
+        err = y_true - y_pred
+        abs_sum += float(np.abs(err).sum())
+        sq_sum += float(np.square(err).sum())
+        n += len(err)
+
+    reg = XGBRegressor(**params, n_jobs=n_jobs)
+    reg.load_model(bytearray(booster.save_raw("ubj")))
+    return reg, vocabulary, {"mae": abs_sum / n, "rmse": math.sqrt(sq_sum / n)}
 
 
 def train_regressor(
     data_path: str = "data/raw/synthetic_construction_projects.csv",
     model_path: str = "models/margin_model.pkl",
+    external_memory: bool = False,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    n_jobs: int = -1,
+    use_tuned: bool = False,
+    cv_folds: int = 0,
+    cv_split: str = "auto",
+    cv_group_column: Optional[str] = None,
+    cv_time_column: Optional[str] = None,
 ) -> dict:
     """
-    Обучение модели маржи и сохранение на диск.
+    Обучение модели маржи и сохранение на диск
+    (вместе со словарём категорий рядом с моделью).
     Возвращает MAE и RMSE на тесте.
+
+    external_memory=True — обучение с ограниченной памятью: XGBoost получает
+    данные кусками по chunk_rows строк (hist + external-memory DMatrix).
+    n_jobs — потоки XGBoost (-1 — все ядра).
+    use_tuned=True — гиперпараметры из последнего подбора в реестре
+    (см. src/tuning.py), если он был на тех же данных.
+    cv_folds > 0 — дополнительно k-fold кросс-валидация (cv_split: auto,
+    kfold, stratified, group — по колонке cv_group_column, time — по
+    cv_time_column или порядку строк; auto с колонкой выбирает group/time,
+    см. src/cross_validation.py), итог в metrics["cv"]; только для обучения
+    в памяти. Несовместимые cv_split и колонка — ValueError до обучения.
     """
-    df = pd.read_csv(data_path)
-    df_enc = _encode_categories(df)
+    if cv_folds:
+        cv_split = resolve_split("margin", cv_split, cv_group_column, cv_time_column)
+    params = tuned_params(model_path, REGRESSOR_PARAMS, data_path) if use_tuned else REGRESSOR_PARAMS
+    if external_memory:
+        with span("train_regressor.external"):
+            reg, vocabulary, metrics = _train_regressor_external(data_path, chunk_rows, params, n_jobs)
+        with span("train_regressor.save"):
+            _save_model(reg, model_path, vocabulary, metrics, data_path)
+        print(f"Margin model saved to {model_path}")
+        print(f"MAE: {metrics['mae']:.4f}, RMSE: {metrics['rmse']:.4f}")
+        return metrics
 
-    X = df_enc[FEATURE_COLUMNS]
-    y = df_enc["actual_margin"]
+    with span("train_regressor.load") as s:
+        df = load_dataset(data_path, columns=CATEGORICAL_COLUMNS + ["actual_margin"])
+        vocabulary = fit_category_vocabulary(df)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
+        X = pd.DataFrame(
+            load_feature_matrix(data_path, vocabulary), columns=FEATURE_COLUMNS, copy=False
+        )
+        y = df["actual_margin"]
+        s.rows = len(X)
 
-    reg = XGBRegressor(
-        n_estimators=200,
-        max_depth=5,
-        learning_rate=0.1,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        random_state=42,
-        n_jobs=-1,
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZE, random_state=SPLIT_RANDOM_STATE
     )
-    reg.fit(X_train, y_train)
 
-    y_pred = reg.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    mse = mean_squared_error(y_test, y_pred)
-    rmse = math.sqrt(mse)
+    reg = _make_regressor(n_jobs=n_jobs, params=params)
+    with span("train_regressor.fit", rows=len(X_train)):
+        reg.fit(X_train, y_train)
 
-    Path(model_path).parent.mkdir(parents=True, exist_ok=True)
-    joblib.dump(reg, model_path)
+    with span("train_regressor.evaluate", rows=len(X_test)):
+        metrics = _evaluate_regressor(reg, X_test, y_test)
+    if cv_folds:
+        with span("train_regressor.cv", folds=cv_folds):
+            metrics["cv"] = cv_metrics(
+                data_path, "margin", cv_folds, cv_split, params, cv_group_column, cv_time_column
+            )
+    with span("train_regressor.save"):
+        _save_model(reg, model_path, vocabulary, metrics, data_path)
 
-    metrics = {"mae": mae, "rmse": rmse}
     print(f"Margin model saved to {model_path}")
-    print(f"MAE: {mae:.4f}, RMSE: {rmse:.4f}")
+    print(f"MAE: {metrics['mae']:.4f}, RMSE: {metrics['rmse']:.4f}")
     return metrics
-
-
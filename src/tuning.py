@@ -0,0 +1,332 @@
+import argparse
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .profiling import span
+
+
+DATA_PATH = "data/raw/synthetic_construction_projects.csv"
+MARGIN_MODEL_PATH = "models/margin_model.pkl"
+RISK_MODEL_PATH = "models/risk_model.pkl"
+
+# Пространство поиска: (распределение, нижняя, верхняя граница)
+SEARCH_SPACE = {
+    "max_depth": ("int", 3, 8),
+    "learning_rate": ("log", 0.02, 0.3),
+    "subsample": ("uniform", 0.6, 1.0),
+    "colsample_bytree": ("uniform", 0.6, 1.0),
+    "min_child_weight": ("log", 1.0, 20.0),
+    "reg_lambda": ("log", 0.1, 10.0),
+}
+
+# Цели подбора: колонка, класс модели, метрика ранней остановки на валидации
+TARGETS = {
+    "margin": {"column": "actual_margin", "model_class": "XGBRegressor", "metric": "mae", "maximize": False},
+    "risk": {"column": "budget_overrun", "model_class": "XGBClassifier", "metric": "auc", "maximize": True},
+}
+
+N_CONFIGS = 27
+MIN_TREES = 50
+MAX_TREES = 1000
+ETA = 3
+EARLY_STOPPING_ROUNDS = 20
+# Значения XGBoost по умолчанию для параметров, которых нет в тренерах
+XGBOOST_DEFAULTS = {"min_child_weight": 1.0, "reg_lambda": 1.0}
+VALID_SIZE = 0.2
+
+
+def sample_configs(n: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    n случайных конфигураций из SEARCH_SPACE (log — равномерно по логарифму).
+    """
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, (kind, low, high) in SEARCH_SPACE.items():
+            if kind == "int":
+                config[name] = int(rng.integers(low, high + 1))
+            elif kind == "log":
+                config[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+            else:
+                config[name] = float(rng.uniform(low, high))
+        configs.append(config)
+    return configs
+
+
+# --- Рабочий процесс ---------------------------------------------------
+# Матрицы train/valid лежат в .npy рабочего каталога; каждый процесс
+# открывает их через memory map один раз (страницы общие через page cache).
+
+_ARRAYS: Dict[str, np.ndarray] = {}
+
+
+def _array(work_dir: str, name: str) -> np.ndarray:
+    path = os.path.join(work_dir, f"{name}.npy")
+    if path not in _ARRAYS:
+        _ARRAYS[path] = np.load(path, mmap_mode="r")
+    return _ARRAYS[path]
+
+
+def _fit_config(
+    work_dir: str,
+    target: str,
+    base_params: Dict[str, Any],
+    config: Dict[str, Any],
+    n_estimators: int,
+    n_jobs: int,
+) -> Dict[str, Any]:
+    """
+    Обучение одной конфигурации с бюджетом n_estimators деревьев
+    и ранней остановкой по метрике цели на валидации.
+    """
+    import xgboost
+
+    spec = TARGETS[target]
+    params = {**base_params, **config, "n_estimators": n_estimators}
+    params.update(
+        eval_metric=spec["metric"],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        tree_method="hist",
+        n_jobs=n_jobs,
+    )
+    model = getattr(xgboost, spec["model_class"])(**params)
+
+    t0 = time.perf_counter()
+    model.fit(
+        _array(work_dir, "X_train"),
+        _array(work_dir, f"y_train_{target}"),
+        eval_set=[(_array(work_dir, "X_valid"), _array(work_dir, f"y_valid_{target}"))],
+        verbose=False,
+    )
+    return {
+        "score": float(model.best_score),
+        "best_iteration": int(model.best_iteration),
+        "fit_s": time.perf_counter() - t0,
+    }
+
+
+# --- Successive halving ------------------------------------------------
+
+def _trainer_test_indices(stratify: np.ndarray) -> np.ndarray:
+    """
+    Строки, на которых тренеры считают тестовые метрики: тест train_regressor
+    (без стратификации) и тест train_classifier / train_models
+    (стратификация по budget_overrun) — те же вызовы train_test_split.
+    """
+    from sklearn.model_selection import train_test_split
+
+    from .train_regressor import SPLIT_RANDOM_STATE, TEST_SIZE
+
+    rows = np.arange(len(stratify))
+    _, regressor_test = train_test_split(rows, test_size=TEST_SIZE, random_state=SPLIT_RANDOM_STATE)
+    _, classifier_test = train_test_split(
+        rows, test_size=TEST_SIZE, random_state=SPLIT_RANDOM_STATE, stratify=stratify
+    )
+    return np.union1d(regressor_test, classifier_test)
+
+
+def _prepare_work_dir(data_path: str, targets: Sequence[str], work_dir: str, seed: int) -> int:
+    """
+    Разбиение train/valid для всех целей; матрицы пишутся в work_dir.
+    Тестовые строки тренеров исключаются целиком: ранняя остановка
+    и отбор конфигураций не видят данных, на которых потом сообщаются
+    метрики обучения с use_tuned=True. Остаток делится на train/valid
+    со стратификацией по budget_overrun. Возвращает число строк train.
+    """
+    from sklearn.model_selection import train_test_split
+
+    from .dataset import load_dataset, load_feature_matrix
+    from .features import CATEGORICAL_COLUMNS, fit_category_vocabulary
+
+    columns = [TARGETS[t]["column"] for t in TARGETS]
+    df = load_dataset(data_path, columns=CATEGORICAL_COLUMNS + columns)
+    X = load_feature_matrix(data_path, fit_category_vocabulary(df))
+    stratify = df["budget_overrun"].to_numpy()
+    test_idx = _trainer_test_indices(stratify)
+    remainder = np.setdiff1d(np.arange(len(df)), test_idx)
+    train_idx, valid_idx = train_test_split(
+        remainder, test_size=VALID_SIZE, random_state=seed, stratify=stratify[remainder]
+    )
+    if np.intersect1d(valid_idx, test_idx).size or np.intersect1d(train_idx, test_idx).size:
+        raise RuntimeError("Выборки подбора пересекаются с тестовой выборкой тренеров")
+    train_idx.sort()
+    valid_idx.sort()
+
+    np.save(os.path.join(work_dir, "X_train.npy"), X[train_idx])
+    np.save(os.path.join(work_dir, "X_valid.npy"), X[valid_idx])
+    for target in targets:
+        y = df[TARGETS[target]["column"]].to_numpy()
+        np.save(os.path.join(work_dir, f"y_train_{target}.npy"), y[train_idx])
+        np.save(os.path.join(work_dir, f"y_valid_{target}.npy"), y[valid_idx])
+    return len(train_idx)
+
+
+def successive_halving(
+    pool: ProcessPoolExecutor,
+    work_dir: str,
+    target: str,
+    base_params: Dict[str, Any],
+    configs: List[Dict[str, Any]],
+    min_trees: int = MIN_TREES,
+    max_trees: int = MAX_TREES,
+    eta: int = ETA,
+    n_jobs: int = 1,
+) -> List[Dict[str, Any]]:
+    """
+    Successive halving по числу деревьев: все конфигурации получают
+    min_trees деревьев, в следующий раунд проходит лучшая 1/eta,
+    бюджет растёт в eta раз (до max_trees). Конфигурации раунда
+    обучаются параллельно в pool.
+
+    Возвращает leaderboard — по строке на каждую (конфигурацию, раунд).
+    """
+    maximize = TARGETS[target]["maximize"]
+    alive = list(range(len(configs)))
+    budget = min_trees
+    leaderboard: List[Dict[str, Any]] = []
+    rung = 0
+    while True:
+        with span(f"tuning.{target}.rung{rung}", configs=len(alive), trees=budget):
+            futures = [
+                pool.submit(_fit_config, work_dir, target, base_params, configs[i], budget, n_jobs)
+                for i in alive
+            ]
+            rows = [
+                {"config_id": i, "rung": rung, "n_estimators": budget, **f.result(), "params": configs[i]}
+                for i, f in zip(alive, futures)
+            ]
+        rows.sort(key=lambda r: r["score"], reverse=maximize)
+        leaderboard.extend(rows)
+        print(
+            f"  {target} rung {rung}: {len(rows)} конфигураций × {budget} деревьев, "
+            f"лучший {TARGETS[target]['metric']} = {rows[0]['score']:.4f}"
+        )
+
+        if budget >= max_trees or len(rows) == 1:
+            return leaderboard
+        alive = [r["config_id"] for r in rows[: max(1, len(rows) // eta)]]
+        budget = min(budget * eta, max_trees)
+        rung += 1
+
+
+def tune_models(
+    data_path: str = DATA_PATH,
+    margin_model_path: str = MARGIN_MODEL_PATH,
+    risk_model_path: str = RISK_MODEL_PATH,
+    targets: Sequence[str] = ("margin", "risk"),
+    n_configs: int = N_CONFIGS,
+    min_trees: int = MIN_TREES,
+    max_trees: int = MAX_TREES,
+    eta: int = ETA,
+    n_workers: Optional[int] = None,
+    seed: int = 42,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Подбор гиперпараметров моделей маржи и риска successive halving'ом.
+
+    Кандидаты — текущие параметры тренеров (config_id 0) и n_configs - 1
+    случайных из SEARCH_SPACE. Процессы пула делят одну memory-mapped
+    матрицу train/valid; каждый обучает XGBoost в n_jobs = ядра / n_workers
+    потоков. Лучшая конфигурация (n_estimators — по ранней остановке)
+    и leaderboard пишутся в реестр (tuning.json рядом с версиями модели),
+    откуда их берут train_regressor / train_classifier с use_tuned=True.
+    """
+    from .dataset import dataset_hash
+    from .registry import model_name_for, registry_dir_for, save_tuning
+    from .train_classifier import CLASSIFIER_PARAMS
+    from .train_regressor import REGRESSOR_PARAMS
+
+    model_paths = {"margin": margin_model_path, "risk": risk_model_path}
+    defaults = {"margin": REGRESSOR_PARAMS, "risk": CLASSIFIER_PARAMS}
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(prefix="tuning-") as work_dir:
+        with span("tuning.prepare") as s:
+            s.rows = _prepare_work_dir(data_path, targets, work_dir, seed)
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as pool:
+            for target in targets:
+                base_params = {
+                    k: v for k, v in defaults[target].items() if k not in SEARCH_SPACE and k != "eval_metric"
+                }
+                base_params.pop("n_estimators")
+                baseline = {
+                    name: defaults[target].get(name, XGBOOST_DEFAULTS.get(name)) for name in SEARCH_SPACE
+                }
+                configs = [baseline] + sample_configs(n_configs - 1, seed)
+
+                print(f"Подбор {target}: {len(configs)} конфигураций, {n_workers} процессов")
+                t0 = time.perf_counter()
+                leaderboard = successive_halving(
+                    pool, work_dir, target, base_params, configs, min_trees, max_trees, eta, n_jobs
+                )
+                final_rung = max(r["rung"] for r in leaderboard)
+                best = next(r for r in leaderboard if r["rung"] == final_rung)
+                tuning = {
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "data_hash": dataset_hash(data_path),
+                    "metric": TARGETS[target]["metric"],
+                    "maximize": TARGETS[target]["maximize"],
+                    "best_score": best["score"],
+                    "best_params": {**best["params"], "n_estimators": best["best_iteration"] + 1},
+                    "baseline_score": next(
+                        r["score"] for r in reversed(leaderboard) if r["config_id"] == 0
+                    ),
+                    "search": {
+                        "n_configs": len(configs),
+                        "min_trees": min_trees,
+                        "max_trees": max_trees,
+                        "eta": eta,
+                        "early_stopping_rounds": EARLY_STOPPING_ROUNDS,
+                        "seed": seed,
+                        "wall_s": time.perf_counter() - t0,
+                    },
+                    "leaderboard": leaderboard,
+                }
+                model_path = model_paths[target]
+                path = save_tuning(model_name_for(model_path), tuning, registry_dir_for(model_path))
+                print(
+                    f"  лучший {tuning['metric']} = {tuning['best_score']:.4f} "
+                    f"(текущие параметры: {tuning['baseline_score']:.4f}) -> {path}"
+                )
+                results[target] = tuning
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Подбор гиперпараметров XGBoost (successive halving)")
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument("--n-configs", type=int, default=N_CONFIGS)
+    parser.add_argument("--min-trees", type=int, default=MIN_TREES)
+    parser.add_argument("--max-trees", type=int, default=MAX_TREES)
+    parser.add_argument("--eta", type=int, default=ETA)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    tune_models(
+        args.data_path,
+        targets=args.targets,
+        n_configs=args.n_configs,
+        min_trees=args.min_trees,
+        max_trees=args.max_trees,
+        eta=args.eta,
+        n_workers=args.workers,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Пакет src импортируется из корня репозитория
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,17 @@
+"""
+Регрессионный тест холодного старта: импорт модулей пакета укладывается
+в бюджет и не тянет тяжёлые зависимости (src/benchmarks.py --check-imports).
+"""
+import pytest
+
+from src.benchmarks import HEAVY_MODULES, IMPORT_BUDGETS_S, check_import_times
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGETS_S))
+def test_import_time(module):
+    # Каждый замер — в свежем интерпретаторе (subprocess)
+    (row,) = check_import_times({module: IMPORT_BUDGETS_S[module]})
+    assert not row["heavy"], f"{module} импортирует {row['heavy']} (запрещены: {HEAVY_MODULES})"
+    assert row["import_s"] <= row["budget_s"], (
+        f"импорт {module}: {row['import_s']:.3f}s > бюджета {row['budget_s']:.1f}s"
+    )